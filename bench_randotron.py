@@ -0,0 +1,326 @@
+"""Offline load test for randotron9000.
+
+Drives the real command/queue/playback code against a fake Discord voice layer, a stubbed
+yt_dlp.YoutubeDL with configurable latency and a fake Spotify scraper, then reports
+time-to-first-audio, inter-track gaps, command throughput, event-loop lag and memory per
+guild as the number of guilds grows.
+
+    python bench_randotron.py --guilds 1,10,100,1000 --extract-latency 0.02
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The bot reads its configuration at import time, so point everything at throwaway local state first
+_scratch = tempfile.mkdtemp(prefix='randotron-bench-')
+os.environ.setdefault('DISCORD_TOKEN', 'bench-token')
+os.environ['EXTRACTOR_PROCESSES'] = '0'
+os.environ['STREAM_AUDIO'] = '1'
+os.environ['AUDIO_CACHE_DIR'] = os.path.join(_scratch, 'audio')
+os.environ['SEARCH_CACHE_PATH'] = ':memory:'
+os.environ['STATE_DB_PATH'] = ':memory:'
+os.environ.setdefault('PROGRESS_INTERVAL', '1')
+
+import randotron9000 as bot_module  # noqa: E402
+import randotron_extractor  # noqa: E402
+
+
+class FakeYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL: answers searches and URL lookups after a fixed delay"""
+    latency = 0.0
+
+    def __init__(self, options=None):
+        self.options = options
+
+    @staticmethod
+    def sanitize_info(info, remove_private_keys=False):
+        return info
+
+    @staticmethod
+    def _entry(key):
+        video_id = hashlib.sha1(key.encode()).hexdigest()[:11]
+        return {
+            'id': video_id,
+            'title': f"Bench track {key}",
+            'duration': 180,
+            'thumbnail': None,
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+            'url': f"https://bench.invalid/stream/{video_id}",
+            'acodec': 'opus',
+        }
+
+    def extract_info(self, url, download=False):
+        time.sleep(self.latency)
+        if url.startswith('ytsearch:'):
+            return {'entries': [self._entry(url[len('ytsearch:'):])]}
+        return self._entry(url)
+
+
+class FakeSpotifyClient:
+    tracks_per_playlist = 5
+
+    def get_playlist_info(self, url):
+        return {'tracks': [{'id': f"{url}-{i}", 'name': f"Song {i}", 'artists': [{'name': url}]}
+                           for i in range(self.tracks_per_playlist)]}
+
+    get_album_info = get_playlist_info
+
+    def get_track_info(self, url):
+        return self.get_playlist_info(url)['tracks'][0]
+
+    def close(self):
+        pass
+
+
+class FakeSource:
+    """Replaces the FFmpeg-backed players so no processes are spawned"""
+    def __init__(self, data, volume):
+        self.data = data
+        self.volume = volume
+        self.filename = None
+
+    @classmethod
+    def from_data(cls, data, *, start_at=0, volume=0.5):
+        return cls(data, volume)
+
+    def cleanup(self):
+        pass
+
+
+class FakeMessage:
+    edits = 0
+    ids = iter(range(1, 1 << 62))
+
+    def __init__(self, channel):
+        self.id = next(FakeMessage.ids)
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        FakeMessage.edits += 1
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.name = f"bench-{channel_id}"
+        self.members = []
+
+    async def send(self, *args, **kwargs):
+        return FakeMessage(self)
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.voice_client = None
+
+
+class FakeVoiceClient:
+    """Plays each source for a fixed wall-clock time, then fires the after callback like discord.py does"""
+    def __init__(self, guild, channel, stats, track_seconds):
+        self.guild = guild
+        self.channel = channel
+        self.stats = stats
+        self.track_seconds = track_seconds
+        self.source = None
+        self.after = None
+        self.plays = 0
+        self.ended_at = None
+        self.handle = None
+        self.paused = False
+
+    def play(self, source, *, after=None):
+        now = time.perf_counter()
+        if self.plays == 0:
+            self.stats['first_audio'].append(now - self.stats['started'][self.guild.id])
+        elif self.ended_at is not None:
+            self.stats['gaps'].append(now - self.ended_at)
+        self.plays += 1
+        self.source = source
+        self.after = after
+        self.handle = asyncio.get_running_loop().call_later(self.track_seconds, self._finish)
+
+    def _finish(self):
+        self.handle = None
+        self.ended_at = time.perf_counter()
+        self.source = None
+        if self.after:
+            self.after(None)
+
+    def is_playing(self):
+        return self.handle is not None and not self.paused
+
+    def is_paused(self):
+        return self.handle is not None and self.paused
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        if self.handle:
+            self.handle.cancel()
+            self._finish()
+
+    async def disconnect(self):
+        self.stop()
+
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeContext:
+    def __init__(self, guild, channel):
+        self.guild = guild
+        self.channel = channel
+        self.author = type('Author', (), {'voice': type('Voice', (), {'channel': channel})()})()
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    def typing(self):
+        return FakeTyping()
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+
+async def measure_lag(samples, interval=0.01):
+    while True:
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - before - interval)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_scale(guild_count, args):
+    bot_module.guild_queues.clear()
+    bot_module.spotify_resolve_limits.clear()
+    bot_module.guild_imports.clear()
+    bot_module.search_cache.memory.clear()
+    bot_module.search_cache.dirty.clear()
+    bot_module.search_cache.db.execute('DELETE FROM search_cache')
+    FakeMessage.edits = 0
+
+    stats = {'first_audio': [], 'gaps': [], 'started': {}}
+    lag = []
+    lag_task = asyncio.ensure_future(measure_lag(lag))
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    contexts = []
+    for index in range(guild_count):
+        guild = FakeGuild(10_000 + index)
+        channel = FakeChannel(20_000 + index, guild)
+        guild.voice_client = FakeVoiceClient(guild, channel, stats, args.track_seconds)
+        contexts.append(FakeContext(guild, channel))
+
+    # play: one search per guild, which starts playback
+    began = time.perf_counter()
+    for ctx in contexts:
+        stats['started'][ctx.guild.id] = time.perf_counter()
+    await asyncio.gather(*(bot_module.play.callback(ctx, query=f"bench song {ctx.guild.id}") for ctx in contexts))
+    play_seconds = time.perf_counter() - began
+
+    # The Spotify import path on top of the playing track
+    began = time.perf_counter()
+    await asyncio.gather(*(bot_module.play.callback(ctx, query=f"https://open.spotify.com/playlist/bench{ctx.guild.id}")
+                           for ctx in contexts))
+    await asyncio.gather(*(job.task for job in list(bot_module.guild_imports.values())))  # Imports run in the background
+    spotify_seconds = time.perf_counter() - began
+    memory_per_guild = (tracemalloc.get_traced_memory()[0] - baseline) / guild_count
+
+    # show_queue throughput while everything is playing
+    began = time.perf_counter()
+    commands_run = 0
+    for _ in range(args.queue_rounds):
+        for ctx in contexts:
+            await bot_module.show_queue.callback(ctx)
+            commands_run += 1
+    commands_per_second = commands_run / (time.perf_counter() - began)
+
+    # Let tracks change a few times so prefetch/transition gaps show up
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline:
+        if all(ctx.voice_client.plays > args.transitions for ctx in contexts):
+            break
+        await asyncio.sleep(0.05)
+
+    for ctx in contexts:
+        bot_module.get_queue(ctx.guild.id).clear()
+        ctx.voice_client.stop()
+    bot_module.progress_updater.watched.clear()
+    await asyncio.sleep(0.1)
+    lag_task.cancel()
+    tracemalloc.stop()
+
+    return {
+        'guilds': guild_count,
+        'play_seconds': round(play_seconds, 3),
+        'spotify_import_seconds': round(spotify_seconds, 3),
+        'ttfa_p50_ms': round(percentile(stats['first_audio'], 0.5) * 1000, 1),
+        'ttfa_p99_ms': round(percentile(stats['first_audio'], 0.99) * 1000, 1),
+        'gap_p50_ms': round(percentile(stats['gaps'], 0.5) * 1000, 1),
+        'gap_p99_ms': round(percentile(stats['gaps'], 0.99) * 1000, 1),
+        'transitions': len(stats['gaps']),
+        'queue_cmds_per_s': round(commands_per_second, 1),
+        'progress_edits': FakeMessage.edits,
+        'loop_lag_p99_ms': round(percentile(lag, 0.99) * 1000, 2),
+        'loop_lag_max_ms': round(max(lag, default=0) * 1000, 2),
+        'kib_per_guild': round(memory_per_guild / 1024, 1),
+    }
+
+
+async def main(args):
+    FakeYoutubeDL.latency = args.extract_latency
+    FakeSpotifyClient.tracks_per_playlist = args.playlist_tracks
+    randotron_extractor.yt_dlp.YoutubeDL = FakeYoutubeDL
+    bot_module.SpotifyClient = FakeSpotifyClient
+    bot_module.make_player = lambda data, *, start_at=0, volume=0.5: FakeSource.from_data(data, start_at=start_at, volume=volume)
+    bot_module.PLAYER_TYPES = (FakeSource,)
+    bot_module.bot.loop = asyncio.get_running_loop()
+
+    results = []
+    for guild_count in args.guilds:
+        result = await run_scale(guild_count, args)
+        results.append(result)
+        if not args.json:
+            print(' '.join(f"{key}={value}" for key, value in result.items()), flush=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=lambda text: [int(n) for n in text.split(',')], default=[1, 10, 100, 1000],
+                        help="comma-separated guild counts to run (default 1,10,100,1000)")
+    parser.add_argument('--extract-latency', type=float, default=0.01, help="seconds each fake extract_info call takes")
+    parser.add_argument('--playlist-tracks', type=int, default=5, help="tracks per fake Spotify playlist")
+    parser.add_argument('--track-seconds', type=float, default=2.5, help="wall-clock length of each fake track")
+    parser.add_argument('--transitions', type=int, default=3, help="track changes to wait for per guild")
+    parser.add_argument('--queue-rounds', type=int, default=5, help="!queue calls per guild")
+    parser.add_argument('--timeout', type=float, default=60.0, help="cap on the playback phase per scale")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    sys.exit(asyncio.run(main(parser.parse_args())))
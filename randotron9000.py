@@ -1,48 +1,100 @@
 import discord
 from discord.ext import commands
 from discord.ui import Button, View
-import yt_dlp
 import asyncio
-from collections import deque
+import bisect
+from collections import deque, OrderedDict
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import itertools
+import json
+import logging
+import multiprocessing
+import random
 import re
+import sqlite3
+import sys
+import threading
 import time  # <--- ADDED: For time tracking
 import os
-import traceback  # <--- ADDED: For full traceback logging
+import traceback
 from spotify_scraper import SpotifyClient  # <--- ADDED: For Spotify scraping (no API creds needed)
 from discord import app_commands  # Add this import if not already there
 import aiohttp  # Add this import at the top if missing
+from aiohttp import web
 from dotenv import load_dotenv  # <--- ADD this import
+from randotron_extractor import init_extractor_worker, extract_in_worker, extract_playlist_page
+try:
+    import numpy  # Optional: only crossfading in the PCM pipeline needs it
+except ImportError:
+    numpy = None
+
+# Configuration
+load_dotenv()  # <--- ADD this line (loads .env file)
+
+# LOG_LEVEL=DEBUG turns on the per-track file/FFmpeg details and yt-dlp's own output
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+log = logging.getLogger('randotron9000')
+log.setLevel(LOG_LEVEL)
+if not log.handlers:
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-8s %(name)s: %(message)s'))
+    log.addHandler(log_handler)
+    log.propagate = False
+
+# Spawned extractor workers re-run this script as __mp_main__ before taking jobs. They only need
+# randotron_extractor, so the bot's import-time work (opus, the databases, the audio cache scan) is skipped there.
+EXTRACTOR_WORKER = __name__ == '__mp_main__'
 
 # Load opus explicitly
-if not discord.opus.is_loaded():
+if not EXTRACTOR_WORKER and not discord.opus.is_loaded():
     try:
         discord.opus.load_opus('/opt/homebrew/lib/libopus.0.dylib')  # <--- ADDED: Adjust to your exact path from 'find' command
-        print("Successfully loaded libopus.")
+        log.info("Successfully loaded libopus.")
     except Exception as e:
-        print(f"Failed to load libopus: {repr(e)}")
-
-# Configuration
-load_dotenv()  # <--- ADD this line (loads .env file)
+        log.warning("Failed to load libopus: %r", e)
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN');
 
 if DISCORD_TOKEN is None:
     raise ValueError("DISCORD_TOKEN not found in .env file!")
+# Sharding: SHARD_COUNT/SHARD_IDS pick the shards this process runs; BOT_PROCESSES > 1 turns the
+# entry point into a launcher that spreads the shards over that many bot processes
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_IDS = [int(shard) for shard in os.getenv('SHARD_IDS', '').split(',') if shard.strip()] or None
+BOT_PROCESSES = int(os.getenv('BOT_PROCESSES', '1'))
+BOT_PROCESS_INDEX = os.getenv('BOT_PROCESS_INDEX')  # Set by the launcher for each bot process it spawns
+CONTROL_HOST = os.getenv('CONTROL_HOST', '127.0.0.1')
+CONTROL_PORT = int(os.getenv('CONTROL_PORT', '8765'))
+CONTROL_REPORT_INTERVAL = 15
+
+if BOT_PROCESS_INDEX is not None and SHARD_IDS is None:
+    # With no shard ids AutoShardedBot would run every shard, answering commands alongside the other processes
+    raise ValueError("A launched bot process needs SHARD_IDS!")
+
 # Bot setup
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+if SHARD_COUNT or SHARD_IDS:
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents)
+
+# Downloaded audio is kept here (named by video id) and reused until evicted
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', '/tmp/randotron9000')
+AUDIO_CACHE_BYTES = int(os.getenv('AUDIO_CACHE_BYTES', str(2 * 1024 ** 3)))
 
 # yt-dlp options
 ytdl_format_options = {
     'format': 'bestaudio/best',
-    'outtmpl': '/tmp/%(id)s.%(ext)s',
+    'outtmpl': os.path.join(AUDIO_CACHE_DIR, '%(id)s.%(ext)s'),
     'restrictfilenames': True,
     'noplaylist': True,
     'nocheckcertificate': True,
     'ignoreerrors': False,
     'logtostderr': False,
-    'quiet': False,  # Keep False for debugging
+    'quiet': LOG_LEVEL != 'DEBUG',  # yt-dlp's progress output is only useful when debugging
     'no_warnings': True,
     'default_search': 'ytsearch',
     'source_address': '0.0.0.0',
@@ -52,18 +104,638 @@ ffmpeg_options = {
     'options': '-vn'  # <--- CHANGED: Removed 'before_options' to avoid invalid option errors for local files
 }
 
-ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+# Remote stream URLs need reconnect flags so FFmpeg survives dropped HTTP connections
+ffmpeg_stream_options = {
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+    'options': '-vn'
+}
+
+FFMPEG_EXECUTABLE = os.getenv('FFMPEG_PATH', '/opt/homebrew/bin/ffmpeg')
+
+# Stream audio straight from the resolved URL; set STREAM_AUDIO=0 to download to disk first
+STREAM_AUDIO = os.getenv('STREAM_AUDIO', '1') != '0'
+
+# 'pcm' decodes to PCM and scales volume in Python; 'opus' has FFmpeg apply volume and emit Opus directly
+AUDIO_PIPELINE = os.getenv('AUDIO_PIPELINE', 'pcm')
+
+# Upper bounds (seconds) of the buckets every latency histogram uses
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class Histogram:
+    """Cumulative bucket counts for one latency series, Prometheus style"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        """Estimate a quantile by interpolating inside the bucket it falls in, or None with no samples"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class Metrics:
+    """Process-wide counters and latency histograms, rendered in the Prometheus text format"""
+    def __init__(self):
+        self.lock = threading.Lock()  # Voice and executor threads record too
+        self.described = {}  # metric name -> (type, help text), in render order
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.collectors = {}  # metric name -> callable returning [(labels dict, value)] read at render time
+
+    def describe(self, name, kind, text):
+        self.described[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def total(self, name):
+        with self.lock:
+            return sum(value for (metric, _), value in self.counters.items() if metric == name)
+
+    def summary(self, name):
+        """'p50 … • p95 …' for an unlabelled histogram, for !stats"""
+        histogram = self.histograms.get((name, ()))
+        if histogram is None or not histogram.count:
+            return "No samples yet"
+        return (f"p50 {histogram.quantile(0.5) * 1000:.0f} ms • p95 {histogram.quantile(0.95) * 1000:.0f} ms "
+                f"({histogram.count})")
+
+    def render(self):
+        def labelled(name, labels):
+            if not labels:
+                return name
+            return name + '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = [(key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                          for key, histogram in self.histograms.items()]
+        lines = []
+        for name, (kind, text) in self.described.items():
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+            if kind == 'histogram':
+                for (metric, labels), buckets, counts, total, count in histograms:
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                        cumulative += bucket_count
+                        lines.append(f"{labelled(name + '_bucket', labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{labelled(name + '_sum', labels)} {total}")
+                    lines.append(f"{labelled(name + '_count', labels)} {count}")
+                continue
+            samples = [(labels, value) for (metric, labels), value in counters if metric == name]
+            if name in self.collectors:
+                samples += [(tuple(sorted(labels.items())), value) for labels, value in self.collectors[name]()]
+            lines += [f"{labelled(name, labels)} {value}" for labels, value in samples]
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.describe('randotron_extract_seconds', 'histogram', "yt-dlp metadata extraction time")
+metrics.describe('randotron_download_seconds', 'histogram', "yt-dlp extraction plus audio download time")
+metrics.describe('randotron_first_frame_seconds', 'histogram', "Time from starting a track to its first audio frame")
+metrics.describe('randotron_embed_edit_seconds', 'histogram', "Now-playing message edit latency")
+metrics.describe('randotron_autocomplete_seconds', 'histogram', "Time to answer a /p autocomplete request")
+metrics.describe('randotron_errors_total', 'counter', "Errors by where they happened")
+metrics.describe('randotron_cache_requests_total', 'counter', "Cache lookups by cache and result")
+
+# yt-dlp runs in worker processes so extraction doesn't fight the gateway and voice threads for the GIL.
+# EXTRACTOR_PROCESSES=0 falls back to a thread pool inside the bot process.
+EXTRACTOR_PROCESSES = int(os.getenv('EXTRACTOR_PROCESSES', '4'))
+EXTRACTOR_TIMEOUT = float(os.getenv('EXTRACTOR_TIMEOUT', '120'))
+
+class ExtractorPool:
+    """Queue of yt-dlp extract_info jobs served by a pool of workers, each with its own YoutubeDL"""
+    def __init__(self, processes, options):
+        self.processes = processes
+        self.options = options
+        self.executor = None
+        self.pending = 0
+    
+    def _get_executor(self):
+        if self.executor is None:
+            if self.processes > 0:
+                # spawn, not fork: the bot process is full of threads (voice, executors) that fork would copy mid-flight
+                self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                                    initializer=init_extractor_worker, initargs=(self.options,))
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ytdl',
+                                                   initializer=init_extractor_worker, initargs=(self.options,))
+        return self.executor
+    
+    async def extract(self, url, *, download=False, timeout=EXTRACTOR_TIMEOUT):
+        """Run extract_info(url) on a worker; cancelling or timing out drops the job if it hasn't started yet"""
+        histogram = 'randotron_download_seconds' if download else 'randotron_extract_seconds'
+        return await self._run(histogram, timeout, extract_in_worker, url, download)
+    
+    async def playlist_page(self, url, start, count, *, timeout=EXTRACTOR_TIMEOUT):
+        """Flat entries start..start+count-1 (1-based) of a YouTube playlist"""
+        return await self._run('randotron_extract_seconds', timeout, extract_playlist_page, url, start, count)
+    
+    async def _run(self, histogram, timeout, function, *args):
+        future = self._get_executor().submit(function, *args)
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            data = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except BrokenProcessPool:
+            self.executor = None  # A worker died (e.g. OOM); start a fresh pool for the next job
+            metrics.inc('randotron_errors_total', where='extract')
+            raise
+        except Exception:
+            metrics.inc('randotron_errors_total', where='extract')
+            raise
+        finally:
+            future.cancel()
+            self.pending -= 1
+        metrics.observe(histogram, time.perf_counter() - started)
+        return data
+
+extractor = ExtractorPool(EXTRACTOR_PROCESSES, ytdl_format_options)
+
+class AudioCache:
+    """Downloaded audio files keyed by video id, evicted least-recently-used once over max_bytes"""
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # video id -> (path, size), least recently used first
+        self.refs = {}  # video id -> players/lookaheads currently using the file
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # download threads and the event loop both touch this
+        os.makedirs(directory, exist_ok=True)
+        # Re-index what previous runs left behind, oldest first so LRU order roughly survives restarts
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)
+                 if not name.endswith(('.part', '.ytdl'))]
+        for path in sorted(filter(os.path.isfile, paths), key=os.path.getmtime):
+            self._insert(os.path.splitext(os.path.basename(path))[0], path)
+        self._evict()
+    
+    def _insert(self, video_id, path):
+        if video_id in self.entries:
+            self.total_bytes -= self.entries.pop(video_id)[1]
+        size = os.path.getsize(path)
+        self.entries[video_id] = (path, size)
+        self.total_bytes += size
+    
+    def _evict(self):
+        for video_id in list(self.entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if self.refs.get(video_id):
+                continue  # Still playing (or queued up) somewhere
+            path, size = self.entries.pop(video_id)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError as e:
+                log.warning("Cache eviction error: %r", e)
+    
+    def lookup(self, video_id):
+        """Return the cached path for video_id and take a reference on it, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(video_id) if video_id else None
+            if entry and os.path.exists(entry[0]):
+                self.entries.move_to_end(video_id)
+                self.refs[video_id] = self.refs.get(video_id, 0) + 1
+                self.hits += 1
+                return entry[0]
+            if entry:
+                self.total_bytes -= self.entries.pop(video_id)[1]
+            self.misses += 1
+            return None
+    
+    def store(self, video_id, path):
+        """Index a freshly downloaded file and take a reference on it"""
+        with self.lock:
+            self._insert(video_id, path)
+            self.refs[video_id] = self.refs.get(video_id, 0) + 1
+            self._evict()
+    
+    def acquire(self, video_id):
+        """Take another reference on a file someone else already holds one on"""
+        with self.lock:
+            self.refs[video_id] = self.refs.get(video_id, 0) + 1
+    
+    def size_of(self, video_id):
+        entry = self.entries.get(video_id)
+        return entry[1] if entry else 0
+    
+    def release(self, video_id):
+        with self.lock:
+            remaining = self.refs.get(video_id, 0) - 1
+            if remaining > 0:
+                self.refs[video_id] = remaining
+            else:
+                self.refs.pop(video_id, None)
+            self._evict()
+
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_BYTES) if not EXTRACTOR_WORKER else None
+
+YOUTUBE_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/)|youtu\.be/)([\w-]{11})')
+
+def youtube_video_id(url):
+    match = YOUTUBE_ID_RE.search(url or '')
+    return match.group(1) if match else None
+
+# How many upcoming tracks get resolved/downloaded ahead of playback
+PREFETCH_AHEAD = int(os.getenv('PREFETCH_AHEAD', '2'))
+
+class SearchCache:
+    """Lookup key -> Track.to_dict() (or another JSON-able dict) with a TTL, LRU in memory and backed by a SQLite table
+    
+    The database is only touched off the event loop: misses read it on an executor thread, and writes are
+    batched behind a short delay like QueueStore's, since every bot process shares the file.
+    """
+    def __init__(self, path, ttl, max_entries, table='search_cache'):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self.memory = OrderedDict()  # key -> (stored_at, info), least recently used first
+        self.dirty = {}  # key -> (stored_at, info), or None to delete, not yet written to the DB
+        self.flushing = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)  # Shared by every bot process
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, info TEXT NOT NULL, stored_at REAL NOT NULL)')
+        self.db.commit()
+    
+    @staticmethod
+    def normalize(query):
+        return ' '.join(query.casefold().split())
+    
+    async def get(self, key):
+        entry = self.memory.get(key) or self.dirty.get(key)
+        if entry is None and key not in self.dirty:
+            entry = await bot.loop.run_in_executor(None, self._read, key)
+        if entry and time.time() - entry[0] < self.ttl:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            self._trim_memory()
+            self.hits += 1
+            return entry[1]
+        if entry:
+            self.memory.pop(key, None)
+            self._write_behind(key, None)
+        self.misses += 1
+        return None
+    
+    def peek(self, key):
+        """Memory-only lookup that leaves the hit/miss counters alone, for callers that can't wait on the DB"""
+        entry = self.memory.get(key)
+        if entry and time.time() - entry[0] < self.ttl:
+            self.memory.move_to_end(key)
+            return entry[1]
+        return None
+    
+    def put(self, key, info):
+        entry = (time.time(), info)
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        self._trim_memory()
+        self._write_behind(key, entry)
+    
+    def _write_behind(self, key, entry):
+        self.dirty[key] = entry
+        if self.flushing is None or self.flushing.done():
+            self.flushing = bot.loop.create_task(self._flush())
+    
+    async def _flush(self):
+        # Entries put while a batch is being written can't start a flush of their own; pick them up here
+        while self.dirty:
+            await asyncio.sleep(SEARCH_CACHE_FLUSH_DELAY)  # Let a burst (an import's lookups) land as one transaction
+            rows, self.dirty = self.dirty, {}
+            try:
+                await bot.loop.run_in_executor(None, self._write, rows)
+            except Exception:
+                metrics.inc('randotron_errors_total', where='search_cache')
+                log.exception("Search cache write error")
+    
+    def _read(self, key):
+        with self.lock:
+            row = self.db.execute(f'SELECT stored_at, info FROM {self.table} WHERE key = ?', (key,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+    
+    def _write(self, rows):
+        now = time.time()
+        with self.lock:
+            for key, entry in rows.items():
+                if entry is None:
+                    self.db.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                    continue
+                self.db.execute(f'INSERT OR REPLACE INTO {self.table} (key, info, stored_at) VALUES (?, ?, ?)', (key, json.dumps(entry[1]), entry[0]))
+                self.writes += 1
+                if self.writes % 500 == 0:  # Prune expired and overflow rows every so often rather than per write
+                    self.db.execute(f'DELETE FROM {self.table} WHERE stored_at < ?', (now - self.ttl,))
+                    self.db.execute(f'DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY stored_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            self.db.commit()
+    
+    def _trim_memory(self):
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+SEARCH_CACHE_PATH = os.getenv('SEARCH_CACHE_PATH', 'randotron9000_cache.sqlite3')
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', str(7 * 24 * 3600)))
+SEARCH_CACHE_MAX = int(os.getenv('SEARCH_CACHE_MAX', '50000'))
+SEARCH_CACHE_FLUSH_DELAY = float(os.getenv('SEARCH_CACHE_FLUSH_DELAY', '1'))
+search_cache = SearchCache(SEARCH_CACHE_PATH, SEARCH_CACHE_TTL, SEARCH_CACHE_MAX) if not EXTRACTOR_WORKER else None
+
+metrics.describe('randotron_singleflight_shared_total', 'counter', "Lookups/downloads that joined one already in flight instead of starting their own")
+
+class SingleFlight:
+    """Lets concurrent callers asking for the same key share one in-flight task instead of each doing the work"""
+    def __init__(self, name, acquire=None, release=None):
+        self.name = name
+        self.acquire = acquire  # Called with the result for each caller that receives it
+        self.release = release  # Called with a result once no caller is waiting on it any more
+        self.inflight = {}  # key -> [task, waiters]
+    
+    async def run(self, key, factory):
+        """Await factory()'s result, joining the call already running for key if there is one"""
+        entry = self.inflight.get(key)
+        if entry is None:
+            entry = self.inflight[key] = [asyncio.ensure_future(factory()), 0]
+            entry[0].add_done_callback(lambda task, entry=entry: self._finished(key, entry))
+        else:
+            metrics.inc('randotron_singleflight_shared_total', flight=self.name)
+        entry[1] += 1
+        try:
+            # shield: one caller giving up (a cancelled import) mustn't fail everyone else waiting on the key
+            result = await asyncio.shield(entry[0])
+            if self.acquire:
+                self.acquire(result)  # Before the waiter count drops, so the flight's own hold outlives the handover
+            return result
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                if entry[0].done():
+                    self._release(entry[0])
+                else:
+                    entry[0].cancel()  # Nobody is waiting any more
+    
+    def _finished(self, key, entry):
+        if self.inflight.get(key) is entry:
+            del self.inflight[key]
+        if not entry[1]:
+            self._release(entry[0])  # Finished after every caller gave up
+        elif not entry[0].cancelled():
+            entry[0].exception()  # Waiters that gave up never see it; don't log it as unretrieved
+    
+    def _release(self, task):
+        if not task.cancelled() and task.exception() is None and self.release:
+            self.release(task.result())
+
+# Searches share by cache key, resolutions and downloads by video id (or URL); a shared download holds its own
+# audio_cache reference until every caller has taken theirs
+search_flights = SingleFlight('search')
+resolve_flights = SingleFlight('resolve', acquire=lambda data: acquire_resolved(data),
+                               release=lambda data: release_resolved(data))
+
+class Track:
+    """One queued song; every queue/history slot holds one of these compact records"""
+    __slots__ = ('url', 'title', 'duration', 'thumbnail')
+    
+    def __init__(self, url, title, duration=0, thumbnail=None):
+        self.url = url
+        self.title = sys.intern(title or "Unknown title")  # The same songs get queued over and over
+        self.duration = int(duration or 0)
+        self.thumbnail = thumbnail
+    
+    @classmethod
+    def from_entry(cls, entry):
+        """Build a Track from a yt-dlp info dict"""
+        # Use the YouTube link, not the raw stream link (which expires)
+        return cls(entry.get('webpage_url') or entry.get('url'), entry.get('title'), entry.get('duration'), entry.get('thumbnail'))
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['url'], data.get('title'), data.get('duration'), data.get('thumbnail'))
+    
+    def to_dict(self):
+        return {'url': self.url, 'title': self.title, 'duration': self.duration, 'thumbnail': self.thumbnail}
+    
+    def __repr__(self):
+        return f"Track({self.title!r}, {self.url!r})"
+
+async def search_youtube(query):
+    """Top YouTube result for query as a Track (served from search_cache when known), or None"""
+    key = 'yt:' + SearchCache.normalize(query)
+    info = await search_cache.get(key) or await search_flights.run(key, lambda: _search_youtube(query, key))
+    # Every caller gets its own Track, even when they shared the search
+    return Track.from_dict(info) if info else None
+
+async def _search_youtube(query, key):
+    # download=False to extract metadata only
+    data = await extractor.extract(f"ytsearch:{query}", download=False)
+    if 'entries' in data and data['entries']:
+        info = Track.from_entry(data['entries'][0]).to_dict()
+        search_cache.put(key, info)
+        return info
+    return None
+
+# Spotify -> YouTube searches share the extractor pool, and one guild can only use part of it
+SPOTIFY_RESOLVE_PER_GUILD = int(os.getenv('SPOTIFY_RESOLVE_PER_GUILD', '3'))
+spotify_resolve_limits = {}  # guild id -> asyncio.Semaphore
+
+# Spotify scraping runs on its own threads, each reusing one SpotifyClient; results are cached for SPOTIFY_CACHE_TTL
+SPOTIFY_SCRAPER_THREADS = int(os.getenv('SPOTIFY_SCRAPER_THREADS', '4'))
+SPOTIFY_CACHE_TTL = float(os.getenv('SPOTIFY_CACHE_TTL', '900'))
+SPOTIFY_CACHE_SIZE = int(os.getenv('SPOTIFY_CACHE_SIZE', '256'))
+SPOTIFY_PAGE_SIZE = int(os.getenv('SPOTIFY_PAGE_SIZE', '50'))
+
+metrics.describe('randotron_spotify_scrape_seconds', 'histogram', "Time to scrape one Spotify track/playlist/album")
+
+class SpotifyService:
+    """Shared Spotify scraper: pooled clients off the event loop and a TTL cache of track/playlist/album info"""
+    def __init__(self, threads, ttl, max_entries):
+        self.threads = threads
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.executor = None
+        self.local = threading.local()  # Each scraper thread keeps its SpotifyClient (and its connections)
+        self.cache = OrderedDict()  # (kind, url) -> (fetched_at, info), least recently used first
+        self.flights = SingleFlight('spotify')  # Several guilds importing one playlist scrape it once
+    
+    def _scrape(self, kind, url):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = SpotifyClient()
+        return getattr(client, f'get_{kind}_info')(url)
+    
+    async def info(self, kind, url):
+        """Scraped info for a Spotify 'track', 'playlist' or 'album' URL"""
+        key = (kind, url)
+        entry = self.cache.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            self.cache.move_to_end(key)
+            metrics.inc('randotron_cache_requests_total', cache='spotify', result='hit')
+            return entry[1]
+        metrics.inc('randotron_cache_requests_total', cache='spotify', result='miss')
+        return await self.flights.run(key, lambda: self._fetch(kind, url))
+    
+    async def _fetch(self, kind, url):
+        key = (kind, url)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='spotify')
+        try:
+            with metrics.timer('randotron_spotify_scrape_seconds'):
+                info = await bot.loop.run_in_executor(self.executor, self._scrape, kind, url)
+        except Exception:
+            metrics.inc('randotron_errors_total', where='spotify')
+            raise
+        if info:
+            self.cache[key] = (time.monotonic(), info)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return info
+    
+    async def pages(self, kind, url):
+        """Yield a playlist's or album's tracks SPOTIFY_PAGE_SIZE at a time"""
+        info = await self.info(kind, url)
+        tracks = (info or {}).get('tracks') or []
+        for start in range(0, len(tracks), SPOTIFY_PAGE_SIZE):
+            yield tracks[start:start + SPOTIFY_PAGE_SIZE]
+
+spotify = SpotifyService(SPOTIFY_SCRAPER_THREADS, SPOTIFY_CACHE_TTL, SPOTIFY_CACHE_SIZE)
+
+QUEUE_PAGE_SIZE = 10
+
+class TrackQueue:
+    """Upcoming Tracks with O(1) popleft and indexing, in-place edits, paging and a running total duration"""
+    def __init__(self, tracks=()):
+        self._items = list(tracks)
+        self._head = 0  # popleft() just advances this; the dead prefix is compacted lazily
+        self.total_duration = sum(track.duration for track in self._items)
+        self.version = 0  # Bumped on every change so snapshots/renders can tell when they're stale
+    
+    def __len__(self):
+        return len(self._items) - self._head
+    
+    def __iter__(self):
+        return itertools.islice(self._items, self._head, None)
+    
+    def _index(self, position):
+        if not 0 <= position < len(self):
+            raise IndexError("queue position out of range")
+        return self._head + position
+    
+    def __getitem__(self, position):
+        return self._items[self._index(position)]
+    
+    def _compact(self):
+        del self._items[:self._head]
+        self._head = 0
+    
+    def append(self, track):
+        self._items.append(track)
+        self.total_duration += track.duration
+        self.version += 1
+    
+    def appendleft(self, track):
+        if self._head:
+            self._head -= 1
+            self._items[self._head] = track
+        else:
+            self._items.insert(0, track)
+        self.total_duration += track.duration
+        self.version += 1
+    
+    def popleft(self):
+        track = self._items[self._index(0)]
+        self._items[self._head] = None  # Don't keep played tracks alive
+        self._head += 1
+        if self._head >= 64 and self._head * 2 >= len(self._items):
+            self._compact()
+        self.total_duration -= track.duration
+        self.version += 1
+        return track
+    
+    def pop(self, position):
+        """Remove and return the track at a 0-based position"""
+        track = self._items.pop(self._index(position))
+        self.total_duration -= track.duration
+        self.version += 1
+        return track
+    
+    def insert(self, position, track):
+        self._items.insert(self._head + max(0, min(position, len(self))), track)
+        self.total_duration += track.duration
+        self.version += 1
+    
+    def move(self, source, destination):
+        """Move the track at source so it ends up at destination (both 0-based)"""
+        track = self.pop(source)
+        self.insert(destination, track)
+        return track
+    
+    def page(self, start, count):
+        """Up to count tracks from position start, without copying the rest of the queue"""
+        start = self._head + max(0, start)
+        return self._items[start:start + max(0, count)]
+    
+    def shuffle(self):
+        self._compact()
+        random.shuffle(self._items)
+        self.version += 1
+    
+    def clear(self):
+        self._items.clear()
+        self._head = 0
+        self.total_duration = 0
+        self.version += 1
 
 class MusicQueue:
     def __init__(self):
-        self.queue = deque()
+        self.queue = TrackQueue()
         self.current = None
         self.history = deque(maxlen=50)
         self.now_playing_msg = None  # <--- ADDED: Track the message for editing
         self.elapsed = 0  # <--- ADDED: Accumulated elapsed seconds
         self.start_time = None  # <--- ADDED: For resume tracking
-        self.progress_task = None  # <--- ADDED: For update loop
         self.is_looping = False  # <--- ADDED: Loop toggle (placeholder; implement in play_next if needed)
+        self.prefetched = {}  # id(song) -> (song, task resolving its yt-dlp data)
+        self.text_channel_id = None  # Where play_next posts, and where an auto-resume reconnects
+        self.voice_channel_id = None
+        self.resume_at = None  # Offset (seconds) recorded for the next track play_next starts
+        self.volume = 0.5  # Carried from track to track
+        self.control_message_id = None  # The now-playing message with buttons, edited for each new track
+        self.mixer = None  # The MixingSource playing this guild's tracks when GAPLESS_PLAYBACK is on
     
     def add(self, item):
         self.queue.append(item)
@@ -92,22 +764,186 @@ class MusicQueue:
             self.now_playing_msg = None
             self.elapsed = 0
             self.start_time = None
-            if self.progress_task:
-                self.progress_task.cancel()
-            self.progress_task = None
+            self.resume_at = None
+            self.drop_prefetched()
+    
+    def drop_prefetched(self):
+        for song, task in self.prefetched.values():
+            discard_prefetch(task)
+        self.prefetched.clear()
     
     def is_empty(self):
         return len(self.queue) == 0
+    
+    def to_state(self, position):
+        return {
+            'queue': [track.to_dict() for track in self.queue],
+            'history': [track.to_dict() for track in self.history],
+            'current': self.current.to_dict() if self.current else None,
+            'elapsed': position,
+            'is_looping': self.is_looping,
+            'volume': self.volume,
+            'text_channel_id': self.text_channel_id,
+            'voice_channel_id': self.voice_channel_id,
+            'control_message_id': self.control_message_id,
+            'resume_at': self.resume_at,
+        }
+    
+    @classmethod
+    def from_state(cls, state):
+        queue = cls()
+        for track in state['queue']:
+            queue.queue.append(Track.from_dict(track))
+        queue.history.extend(Track.from_dict(track) for track in state['history'])
+        queue.current = Track.from_dict(state['current']) if state['current'] else None
+        queue.elapsed = state['elapsed']
+        queue.is_looping = state['is_looping']
+        queue.volume = state.get('volume', 0.5)
+        queue.text_channel_id = state.get('text_channel_id')
+        queue.voice_channel_id = state.get('voice_channel_id')
+        queue.control_message_id = state.get('control_message_id')
+        queue.resume_at = state.get('resume_at')
+        return queue
+
+def playback_position(queue, voice_client):
+    """Seconds into the current track"""
+    elapsed = queue.elapsed
+    if voice_client and voice_client.is_playing() and queue.start_time:
+        elapsed += time.time() - queue.start_time
+    return elapsed
+
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'randotron9000_state.sqlite3')
+STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', '10'))
+# Rejoin voice and restart each saved guild's track when the bot comes back up
+AUTO_RESUME = os.getenv('AUTO_RESUME', '0') == '1'
+
+class QueueStore:
+    """Write-behind SQLite persistence of every guild's MusicQueue, batched every STATE_FLUSH_INTERVAL"""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)  # Shared by every bot process
+        self.db.execute('CREATE TABLE IF NOT EXISTS guild_state (guild_id INTEGER PRIMARY KEY, state TEXT NOT NULL, saved_at REAL NOT NULL)')
+        self.db.commit()
+        self.written = {}  # guild id -> signature of the state last written
+        self.task = None
+    
+    async def load(self, guild_id):
+        row = await bot.loop.run_in_executor(None, self._read, 'SELECT state FROM guild_state WHERE guild_id = ?', (guild_id,))
+        return MusicQueue.from_state(json.loads(row[0][0])) if row else None
+    
+    async def saved_guild_ids(self):
+        return [row[0] for row in await bot.loop.run_in_executor(None, self._read, 'SELECT guild_id FROM guild_state', ())]
+    
+    def _read(self, query, parameters):
+        with self.lock:
+            return self.db.execute(query, parameters).fetchall()
+    
+    def _snapshot(self, guild_id, queue):
+        # Runs on the event loop: a (guild id, state JSON or None to delete) row, or None if unchanged since last written
+        guild = bot.get_guild(guild_id)
+        position = playback_position(queue, guild.voice_client if guild else None)
+        signature = (queue.queue.version, id(queue.current), queue.is_looping, int(position // STATE_FLUSH_INTERVAL))
+        if self.written.get(guild_id) == signature:
+            return None
+        self.written[guild_id] = signature
+        empty = queue.is_empty() and not queue.current
+        return (guild_id, None if empty else json.dumps(queue.to_state(position)))
+    
+    def _collect(self):
+        rows = (self._snapshot(guild_id, queue) for guild_id, queue in list(guild_queues.items()))
+        return [row for row in rows if row]
+    
+    async def evict(self, guild_id, queue):
+        """Write a queue's final state before it is dropped from guild_queues"""
+        row = self._snapshot(guild_id, queue)
+        self.written.pop(guild_id, None)
+        if row:
+            await bot.loop.run_in_executor(None, self._write, [row])
+    
+    def _write(self, rows):
+        now = time.time()
+        with self.lock:
+            for guild_id, state in rows:
+                if state is None:
+                    self.db.execute('DELETE FROM guild_state WHERE guild_id = ?', (guild_id,))
+                else:
+                    self.db.execute('INSERT OR REPLACE INTO guild_state (guild_id, state, saved_at) VALUES (?, ?, ?)', (guild_id, state, now))
+            self.db.commit()
+    
+    async def run(self):
+        while True:
+            await asyncio.sleep(STATE_FLUSH_INTERVAL)
+            rows = self._collect()
+            if not rows:
+                continue
+            try:
+                await bot.loop.run_in_executor(None, self._write, rows)
+            except Exception:
+                metrics.inc('randotron_errors_total', where='persistence')
+                log.exception("Queue persistence error")
+    
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self.run())
+
+queue_store = QueueStore(STATE_DB_PATH) if not EXTRACTOR_WORKER else None
 
 # Guild-specific music queues
 guild_queues = {}
 
 def get_queue(guild_id):
+    """The guild's queue; commands and buttons load_queue() it first, so this never has to read the DB"""
     if guild_id not in guild_queues:
         guild_queues[guild_id] = MusicQueue()
     return guild_queues[guild_id]
 
+async def load_queue(guild_id):
+    """First touch since startup (or eviction): pick up whatever was saved for this guild, off the event loop"""
+    if guild_id not in guild_queues:
+        saved = await queue_store.load(guild_id)
+        guild_queues.setdefault(guild_id, saved or MusicQueue())
+    return guild_queues[guild_id]
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+if numpy is not None:
+    # Each interleaved s16le sample's position within a 20 ms frame, as a fraction of the frame
+    FRAME_OFFSETS = numpy.repeat(numpy.arange(discord.opus.Encoder.SAMPLES_PER_FRAME) / discord.opus.Encoder.SAMPLES_PER_FRAME,
+                                 discord.opus.Encoder.CHANNELS)
+
+# With NumPy, PCM players measure each track's RMS loudness over its first LOUDNESS_ANALYZE_SECONDS of sound and
+# steer towards LOUDNESS_TARGET_DBFS (within LOUDNESS_MAX_CUT_DB/LOUDNESS_MAX_BOOST_DB); the result is kept per video id
+LOUDNESS_NORMALIZATION = os.getenv('LOUDNESS_NORMALIZATION', '1') != '0' and numpy is not None
+LOUDNESS_TARGET_DBFS = float(os.getenv('LOUDNESS_TARGET_DBFS', '-14'))
+LOUDNESS_MAX_BOOST_DB = float(os.getenv('LOUDNESS_MAX_BOOST_DB', '6'))
+LOUDNESS_MAX_CUT_DB = float(os.getenv('LOUDNESS_MAX_CUT_DB', '12'))
+LOUDNESS_ANALYZE_SECONDS = float(os.getenv('LOUDNESS_ANALYZE_SECONDS', '20'))
+LOUDNESS_SMOOTHING_SECONDS = 2.0  # Time constant for easing towards a new gain estimate
+LOUDNESS_CACHE_SIZE = int(os.getenv('LOUDNESS_CACHE_SIZE', '50000'))
+LOUDNESS_CACHE_TTL = int(os.getenv('LOUDNESS_CACHE_TTL', str(365 * 24 * 3600)))  # A video's loudness doesn't change
+
+SILENCE_POWER = (32768 * 10 ** (-60 / 20)) ** 2  # Frames quieter than -60 dBFS don't count towards loudness
+TARGET_POWER = (32768 * 10 ** (LOUDNESS_TARGET_DBFS / 20)) ** 2
+
+# Measured gains by video id, in their own table next to the search cache
+loudness_store = SearchCache(SEARCH_CACHE_PATH, LOUDNESS_CACHE_TTL, LOUDNESS_CACHE_SIZE, table='loudness_gains') if not EXTRACTOR_WORKER else None
+
+async def load_loudness_gain(video_id):
+    """Pull video_id's stored gain from the DB into memory ahead of playback"""
+    if LOUDNESS_NORMALIZATION and video_id and video_id not in loudness_store.memory:
+        await loudness_store.get(video_id)
+
+def cached_loudness_gain(video_id):
+    """Event loop: the normalization gain load_loudness_gain() or a finished measurement left in memory, or None"""
+    info = loudness_store.peek(video_id) if video_id else None
+    metrics.inc('randotron_cache_requests_total', cache='loudness', result='hit' if info else 'miss')
+    return info['gain'] if info else None
+
+def remember_loudness_gain(video_id, gain):
+    """Voice thread: hand a finished measurement to the event loop to keep in memory and write to the DB"""
+    bot.loop.call_soon_threadsafe(loudness_store.put, video_id, {'gain': gain})
+
 class YTDLSource(discord.PCMVolumeTransformer):
+    """PCM player whose volume (and, with NumPy, loudness normalization) is applied per frame with click-free ramps"""
     def __init__(self, source, *, data, volume=0.5):
         super().__init__(source, volume)
         self.data = data
@@ -115,107 +951,529 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.url = data.get('url')
         self.duration = data.get('duration')
         self.thumbnail = data.get('thumbnail')
+        self.started_at = None  # perf_counter() when play_next began this track, until its first frame
+        
+        self.applied_gain = None  # Gain at the end of the last frame; each frame ramps from it to the new target
+        self.loudness_gain = 1.0  # Current normalization estimate, eased towards by normalization_gain
+        self.normalization_gain = 1.0
+        self.energy = 0.0  # Sum of mean-square power over the measured (non-silent) frames
+        self.measured = 0
+        self.measuring = LOUDNESS_NORMALIZATION and bool(data.get('id'))
+        if self.measuring:
+            cached = cached_loudness_gain(data['id'])
+            if cached is not None:
+                self.loudness_gain = self.normalization_gain = cached
+                self.measuring = False  # Already known from an earlier play
+
+    def read(self):
+        if numpy is None:
+            frame = super().read()
+        else:
+            frame = self.original.read()
+            if frame:
+                frame = self._apply_gain(frame)
+        if self.started_at is not None:
+            metrics.observe('randotron_first_frame_seconds', time.perf_counter() - self.started_at)
+            self.started_at = None
+        return frame
+
+    def _apply_gain(self, frame):
+        samples = numpy.frombuffer(frame, numpy.int16).astype(numpy.float32)
+        if self.measuring:
+            self._measure(samples)
+        if LOUDNESS_NORMALIZATION:
+            self.normalization_gain += (self.loudness_gain - self.normalization_gain) * (FRAME_SECONDS / LOUDNESS_SMOOTHING_SECONDS)
+        
+        target = min(self._volume, 2.0) * self.normalization_gain
+        start = target if self.applied_gain is None else self.applied_gain
+        self.applied_gain = target
+        gains = start + (target - start) * FRAME_OFFSETS if start != target else target
+        return numpy.clip(samples * gains, -32768, 32767).astype(numpy.int16).tobytes()
+
+    def _measure(self, samples):
+        power = float(numpy.dot(samples, samples)) / samples.size
+        if power < SILENCE_POWER:
+            return
+        self.energy += power
+        self.measured += 1
+        if self.measured % 25 and self.measured * FRAME_SECONDS < LOUDNESS_ANALYZE_SECONDS:
+            return  # Re-estimate every half second of sound
+        gain_db = 10 * numpy.log10(TARGET_POWER / (self.energy / self.measured))
+        self.loudness_gain = float(10 ** (max(-LOUDNESS_MAX_CUT_DB, min(LOUDNESS_MAX_BOOST_DB, gain_db)) / 20))
+        if self.measured * FRAME_SECONDS >= LOUDNESS_ANALYZE_SECONDS:
+            self.measuring = False
+            remember_loudness_gain(self.data['id'], self.loudness_gain)
+
+    def take_loudness(self, previous):
+        """Carry a restarted track's measurement and applied gain over from the player it replaces"""
+        self.applied_gain = previous.applied_gain
+        if not self.measuring:
+            return
+        self.measuring = previous.measuring
+        self.energy, self.measured = previous.energy, previous.measured
+        self.loudness_gain, self.normalization_gain = previous.loudness_gain, previous.normalization_gain
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True):  # stream param is unused now, but kept for compatibility
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=True))  # download=True to handle download
+    async def resolve(cls, url, *, stream=True):
+        """Run yt-dlp on url and return the entry's info dict (downloading the audio unless stream)
+        
+        Downloaded results hold an audio_cache reference; hand them to release_resolved() when done.
+        """
+        video_id = youtube_video_id(url)
+        await load_loudness_gain(video_id)  # So the player picks up a stored gain without touching the DB
+        if not stream:
+            cached = audio_cache.lookup(video_id)
+            if cached:
+                return {'id': video_id, 'webpage_url': url, 'requested_downloads': [{'filepath': cached}]}
+        
+        # Concurrent requests for one video share a single extraction, and a single write of its download
+        return dict(await resolve_flights.run((video_id or url, stream), lambda: cls._resolve(url, stream)))
+    
+    @staticmethod
+    async def _resolve(url, stream):
+        data = await extractor.extract(url, download=not stream)
         
         if 'entries' in data:
             data = data['entries'][0]
+        if not stream:
+            audio_cache.store(data['id'], downloaded_path(data))
+        return data
+
+    @classmethod
+    def from_data(cls, data, *, start_at=0, volume=0.5):
+        """Build a player from an info dict returned by resolve(), optionally starting start_at seconds in"""
+        # -ss before -i makes FFmpeg seek the input itself rather than decode and discard up to the offset
+        seek = f"-ss {start_at:.3f} " if start_at else ""
+        filename = downloaded_path(data)
+        if filename is None:
+            options = dict(ffmpeg_stream_options, before_options=seek + ffmpeg_stream_options['before_options'])
+            player = cls(discord.FFmpegPCMAudio(data['url'], executable=FFMPEG_EXECUTABLE, **options), data=data, volume=volume)
+            player.filename = None
+            return player
         
-        print("Data keys from yt-dlp:", list(data.keys()))  # <--- ADDED: Log available keys for debugging
+        if log.isEnabledFor(logging.DEBUG):  # The stat() calls only happen when someone is looking
+            log.debug("Data keys from yt-dlp: %s", list(data.keys()))
+            log.debug("Downloaded filename: %s (%s bytes, mode %s)", filename,
+                      os.stat(filename).st_size if os.path.exists(filename) else 'N/A',
+                      oct(os.stat(filename).st_mode)[-3:] if os.path.exists(filename) else 'N/A')
+            # Roughly what discord.py will run
+            log.debug("FFmpeg command: %s %s-i %s %s -f s16le -ar 48000 -ac 2 pipe:1",
+                      FFMPEG_EXECUTABLE, seek, filename, ffmpeg_options.get('options', ''))
         
-        filename = data['requested_downloads'][0]['filepath']
-        print(f"Downloaded filename: {filename}")  # <--- ADDED: Log filename
-        print(f"File exists: {os.path.exists(filename)}")  # <--- ADDED: Check existence
-        print(f"File size: {os.stat(filename).st_size if os.path.exists(filename) else 'N/A'} bytes")  # <--- ADDED: Check size (should be ~3MB for this song)
-        print(f"File permissions: {oct(os.stat(filename).st_mode)[-3:] if os.path.exists(filename) else 'N/A'}")  # <--- ADDED: Check readable (should be 644 or similar)
+        options = dict(ffmpeg_options, before_options=seek.strip()) if seek else ffmpeg_options
+        player = cls(discord.FFmpegPCMAudio(filename, executable=FFMPEG_EXECUTABLE, **options), data=data, volume=volume)
+        player.filename = filename  # For cleanup
+        return player
+
+    @classmethod
+    async def from_url(cls, url, *, loop=None, stream=True, start_at=0):  # loop is unused now, but kept for compatibility
+        data = await cls.resolve(url, stream=stream)
+        return cls.from_data(data, start_at=start_at)
+
+class YTDLOpusSource(discord.FFmpegOpusAudio):
+    """Player that has FFmpeg apply volume and output Opus, skipping the PCM -> Python -> libopus round trip
+    
+    Volume is baked into the FFmpeg command, so changing it means restarting FFmpeg (see restart_player).
+    """
+    def __init__(self, source, *, data, volume=0.5, **kwargs):
+        super().__init__(source, **kwargs)
+        self.data = data
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.duration = data.get('duration')
+        self.thumbnail = data.get('thumbnail')
+        self._volume = volume
+        self.started_at = None
+    
+    @property
+    def volume(self):
+        return self._volume
+    
+    def read(self):
+        packet = super().read()
+        if self.started_at is not None:
+            metrics.observe('randotron_first_frame_seconds', time.perf_counter() - self.started_at)
+            self.started_at = None
+        return packet
+    
+    @classmethod
+    def from_data(cls, data, *, start_at=0, volume=0.5):
+        """Build a player from an info dict returned by YTDLSource.resolve()"""
+        seek = f"-ss {start_at:.3f} " if start_at else ""
+        filename = downloaded_path(data)
+        before_options = seek.strip() if filename else seek + ffmpeg_stream_options['before_options']
         
-        # Simulate FFmpeg command for logging (what discord.py will roughly run)
-        print(f"Simulated FFmpeg command: /opt/homebrew/bin/ffmpeg -i {filename} {ffmpeg_options.get('options', '')} -f s16le -ar 48000 -ac 2 pipe:1")
+        # Opus input at unity gain is copied straight through; anything else is encoded once, inside FFmpeg.
+        # codec names the *input* codec to FFmpegOpusAudio: 'opus' selects -c:a copy, None selects -c:a libopus.
+        is_opus = data.get('acodec') == 'opus' or (filename or '').endswith(('.webm', '.opus'))
+        if is_opus and volume == 1.0:
+            codec, options = 'opus', '-vn'
+        else:
+            codec, options = None, f'-vn -af volume={volume:.2f}'
         
-        player = cls(discord.FFmpegPCMAudio(filename, executable="/opt/homebrew/bin/ffmpeg", **ffmpeg_options), data=data)
-        player.filename = filename  # For cleanup
+        player = cls(filename or data['url'], data=data, volume=volume, executable=FFMPEG_EXECUTABLE,
+                     codec=codec, before_options=before_options or None, options=options)
+        player.filename = filename
         return player
 
+# PCM-pipeline tracks play back to back through one MixingSource per guild, each opened GAPLESS_LEAD seconds
+# before it's due (needs PREFETCH_AHEAD >= 1). With NumPy installed, CROSSFADE_SECONDS > 0 blends each ending into the next.
+GAPLESS_PLAYBACK = os.getenv('GAPLESS_PLAYBACK', '1') != '0' and AUDIO_PIPELINE == 'pcm'
+GAPLESS_LEAD = float(os.getenv('GAPLESS_LEAD', '15'))
+CROSSFADE_SECONDS = float(os.getenv('CROSSFADE_SECONDS', '0')) if numpy is not None else 0.0
+
+def crossfade_frame(outgoing, incoming, step, steps):
+    """Equal-power blend of one s16le frame from each track, step frames into a steps-frame fade"""
+    angle = (step + FRAME_OFFSETS) * (numpy.pi / 2 / steps)
+    mixed = numpy.frombuffer(outgoing, numpy.int16) * numpy.cos(angle) + numpy.frombuffer(incoming, numpy.int16) * numpy.sin(angle)
+    return numpy.clip(mixed, -32768, 32767).astype(numpy.int16).tobytes()
+
+class MixingSource(discord.AudioSource):
+    """One long-lived source per guild that plays queued tracks back to back, so track changes leave no gap
+    
+    The voice thread reads frames from current. Near the end of a track it asks the event loop to arm() the
+    next one, and switches over (crossfading when enabled) the moment current runs out. If the queue has
+    moved on since arming, it ends instead and play_next takes over as usual.
+    """
+    def __init__(self, player, queue, ctx, *, start_at=0, duration=0):
+        self.lock = threading.Lock()
+        self.queue = queue
+        self.ctx = ctx
+        self.current = player
+        self.duration = duration  # The queued Track's length; cache hits resolve without yt-dlp metadata
+        self.offset = start_at  # Seconds into current when it started reading
+        self.frames = 0
+        self.upcoming = None  # (track, player) opened ahead of time by arm()
+        self.outgoing = None  # The previous player while it fades out
+        self.fade_step = 0
+        self.wanted = False  # Whether the loop has been asked to arm the next track
+        self.arming = None
+    
+    @property
+    def data(self):
+        return self.current.data
+    
+    @property
+    def original(self):
+        return self.current.original
+    
+    @property
+    def volume(self):
+        return self.current.volume
+    
+    @volume.setter
+    def volume(self, value):
+        with self.lock:
+            for player in (self.current, self.outgoing, self.upcoming and self.upcoming[1]):
+                if player:
+                    player.volume = value
+    
+    def _remaining(self):
+        duration = self.current.data.get('duration') or self.duration
+        return duration - self.offset - self.frames * FRAME_SECONDS if duration else None
+    
+    def _still_next(self, track):
+        try:
+            return not self.queue.is_looping and len(self.queue.queue) > 0 and self.queue.queue[0] is track
+        except IndexError:  # Emptied by the event loop mid-check
+            return False
+    
+    def read(self):
+        with self.lock:
+            remaining = self._remaining()
+            if self.outgoing is None and self.upcoming and CROSSFADE_SECONDS and remaining is not None and remaining <= CROSSFADE_SECONDS:
+                self._advance(fade=True)
+            frame = self.current.read()
+            if not frame and self._advance():
+                frame = self.current.read()
+            if self.outgoing is not None:
+                frame = self._fade(frame)
+            if not frame:
+                return b''
+            self.frames += 1
+            remaining = self._remaining()  # current may have just changed to the next track
+            if not self.wanted and (remaining is None or remaining <= GAPLESS_LEAD):
+                self.wanted = True
+                bot.loop.call_soon_threadsafe(self.rearm)
+            return frame
+    
+    def _advance(self, *, fade=False):
+        # Voice thread: swap the armed track in, or report that there's nothing (still) valid to swap to
+        if self.upcoming is None:
+            return False
+        track, player = self.upcoming
+        self.upcoming = None
+        if not self._still_next(track):
+            player.cleanup()
+            return False
+        previous = self.current
+        if fade:
+            self.outgoing = previous
+            self.fade_step = 0
+        else:
+            previous.cleanup()
+        self.current = player
+        self.duration = track.duration
+        self.offset = 0
+        self.frames = 0
+        self.wanted = False
+        asyncio.run_coroutine_threadsafe(track_advanced(self, track, player, previous), bot.loop)
+        return True
+    
+    def _fade(self, incoming):
+        outgoing = self.outgoing.read()
+        steps = max(1, round(CROSSFADE_SECONDS / FRAME_SECONDS))
+        step = self.fade_step
+        self.fade_step += 1
+        if not outgoing or self.fade_step >= steps:
+            self.outgoing.cleanup()
+            self.outgoing = None
+        if not outgoing or not incoming:
+            return incoming or outgoing
+        return crossfade_frame(outgoing, incoming, step, steps)
+    
+    def replace_current(self, player, offset):
+        """Swap in a restarted player for the same track (seek/volume restarts), returning the old one"""
+        with self.lock:
+            previous, self.current = self.current, player
+            self.offset = offset
+            self.frames = 0
+        return previous
+    
+    def rearm(self):
+        """Event loop: (re)open the next track if it's wanted and what's armed isn't next in the queue any more"""
+        if not self.wanted or self.queue.mixer is not self:
+            return
+        if self.upcoming and self._still_next(self.upcoming[0]):
+            return
+        if self.arming is None or self.arming.done():
+            self.arming = bot.loop.create_task(self.arm())
+    
+    async def arm(self):
+        queue = self.queue
+        while self.wanted and queue.mixer is self and not queue.is_looping and not queue.is_empty():
+            track = queue.queue[0]
+            entry = queue.prefetched.get(id(track))
+            if entry is None:
+                return
+            try:
+                data = await asyncio.shield(entry[1])
+            except Exception:
+                return
+            if queue.mixer is not self or queue.is_empty() or queue.queue[0] is not track:
+                continue  # The queue changed while it resolved; go again for the new head
+            player = YTDLSource.from_data(data, volume=queue.volume)
+            with self.lock:
+                stale, self.upcoming = self.upcoming, (track, player)
+            if stale:
+                stale[1].cleanup()
+            return
+    
+    def cleanup(self):
+        with self.lock:
+            for player in (self.current, self.outgoing, self.upcoming and self.upcoming[1]):
+                if player:
+                    player.cleanup()
+            self.outgoing = None
+            self.upcoming = None
+
+PLAYER_TYPES = (YTDLSource, YTDLOpusSource, MixingSource)
+
+def make_player(data, *, start_at=0, volume=0.5):
+    """Player for resolved data using the configured AUDIO_PIPELINE"""
+    player_type = YTDLOpusSource if AUDIO_PIPELINE == 'opus' else YTDLSource
+    return player_type.from_data(data, start_at=start_at, volume=volume)
+
+def restart_player(voice_client, queue, offset, *, volume=None):
+    """Restart FFmpeg for the playing track at offset (and optionally a new volume), reusing its resolved data
+    
+    The voice client's player, and with it the after_playing callback, stays in place.
+    """
+    source = voice_client.source
+    if isinstance(source, MixingSource):
+        # Only the track inside the mixer restarts; the mixer stays the voice client's source
+        current = source.current
+        replacement = type(current).from_data(current.data, start_at=offset, volume=current.volume if volume is None else volume)
+        if isinstance(replacement, YTDLSource):
+            replacement.take_loudness(current)
+        source.replace_current(replacement, offset).cleanup()
+    else:
+        was_paused = voice_client.is_paused()
+        replacement = type(source).from_data(source.data, start_at=offset, volume=source.volume if volume is None else volume)
+        if isinstance(replacement, YTDLSource):
+            replacement.take_loudness(source)
+        voice_client.source = replacement
+        source.cleanup()
+        if was_paused:
+            voice_client.pause()  # Swapping the source resumes the player
+    queue.elapsed = offset
+    queue.start_time = time.time()
+
+def apply_volume(voice_client, queue, volume):
+    """Set a guild's volume: PCM players scale live, Opus players restart FFmpeg at the current position"""
+    queue.volume = volume
+    source = voice_client.source if voice_client else None
+    if isinstance(source, YTDLOpusSource):
+        if source.volume != volume:
+            restart_player(voice_client, queue, playback_position(queue, voice_client), volume=volume)
+    elif source is not None:
+        source.volume = volume
+
+def downloaded_path(data):
+    """Local file yt-dlp wrote for data, or None when it was resolved for streaming"""
+    downloads = data.get('requested_downloads')
+    return downloads[0]['filepath'] if downloads else None
+
+def acquire_resolved(data):
+    """Take another audio_cache reference on a downloaded track someone already holds"""
+    if downloaded_path(data):
+        audio_cache.acquire(data['id'])
+
+def release_resolved(data):
+    """Drop the audio_cache reference resolve() took for a downloaded track"""
+    if downloaded_path(data):
+        audio_cache.release(data['id'])
+
+def _cleanup_resolved(task):
+    """Release the cached file an abandoned lookahead downloaded once it finishes"""
+    if task.cancelled() or task.exception():
+        return
+    release_resolved(task.result())
+
+def discard_prefetch(task):
+    # Cancelling drops an extractor job that hasn't started (a shared one carries on for its other callers);
+    # a lookahead that already finished, or finishes anyway, has its result released
+    task.cancel()
+    task.add_done_callback(_cleanup_resolved)
+
+def prefetch_upcoming(queue):
+    """Start resolving the next PREFETCH_AHEAD songs and drop lookaheads that fell out of that window"""
+    window = {id(song): song for song in itertools.islice(queue.queue, PREFETCH_AHEAD)}
+    for key in list(queue.prefetched):
+        if key not in window:
+            song, task = queue.prefetched.pop(key)
+            discard_prefetch(task)
+    for key, song in window.items():
+        if key not in queue.prefetched:
+            task = bot.loop.create_task(YTDLSource.resolve(song.url, stream=STREAM_AUDIO))
+            queue.prefetched[key] = (song, task)
+    if queue.mixer is not None:
+        queue.mixer.rearm()
+
+def take_prefetched(queue, song):
+    """Claim song's lookahead (if any) and return a coroutine yielding its resolved data"""
+    entry = queue.prefetched.pop(id(song), None)
+    return _await_prefetched(song, entry[1] if entry else None)
+
+async def _await_prefetched(song, task):
+    if task:
+        try:
+            return await task
+        except Exception as e:
+            metrics.inc('randotron_errors_total', where='prefetch')
+            log.warning("Prefetch failed, resolving again: %r", e)
+    return await YTDLSource.resolve(song.url, stream=STREAM_AUDIO)
+
 class MusicControls(View):
-    def __init__(self, bot, ctx):
+    """The now-playing buttons; one instance registered with bot.add_view serves every guild's control message
+    
+    Buttons carry fixed custom_ids and act on whichever guild the interaction came from, so they keep
+    working on messages sent before a restart. Messages get a stopped copy from render(), which draws
+    the current button state without being tracked by the view store.
+    """
+    def __init__(self):
         super().__init__(timeout=None)
-        self.bot = bot
-        self.ctx = ctx
+    
+    async def interaction_check(self, interaction):
+        await load_queue(interaction.guild.id)
+        return True
+    
+    @classmethod
+    def render(cls, queue, voice_client):
+        view = cls()
+        if voice_client and voice_client.is_paused():
+            view.play_pause.label = "Play"
+            view.play_pause.emoji = "▶️"
+        if queue.is_looping:
+            view.loop.style = discord.ButtonStyle.success
+        view.stop()
+        return view
 
-    @discord.ui.button(label="Pause", emoji="⏸️", style=discord.ButtonStyle.primary, row=0)
+    @discord.ui.button(label="Pause", emoji="⏸️", style=discord.ButtonStyle.primary, row=0, custom_id='randotron:pause')
     async def play_pause(self, interaction: discord.Interaction, button: Button):
-        queue = get_queue(self.ctx.guild.id)
-        if self.ctx.voice_client:
-            if self.ctx.voice_client.is_paused():
-                self.ctx.voice_client.resume()
-                button.label = "Pause"
-                button.emoji = "⏸️"
+        queue = get_queue(interaction.guild.id)
+        voice_client = interaction.guild.voice_client
+        if voice_client:
+            if voice_client.is_paused():
+                voice_client.resume()
                 queue.start_time = time.time()
-            elif self.ctx.voice_client.is_playing():
-                self.ctx.voice_client.pause()
-                button.label = "Play"
-                button.emoji = "▶️"
+            elif voice_client.is_playing():
+                voice_client.pause()
                 queue.elapsed += time.time() - queue.start_time
-            await interaction.response.edit_message(view=self)
+            await interaction.response.edit_message(view=self.render(queue, voice_client))
+        else:
+            await interaction.response.defer()
 
-    @discord.ui.button(label="Skip", emoji="⏭️", style=discord.ButtonStyle.secondary, row=0)
+    @discord.ui.button(label="Skip", emoji="⏭️", style=discord.ButtonStyle.secondary, row=0, custom_id='randotron:skip')
     async def skip(self, interaction: discord.Interaction, button: Button):
-        if self.ctx.voice_client:
-            self.ctx.voice_client.stop()
+        if interaction.guild.voice_client:
+            interaction.guild.voice_client.stop()
         await interaction.response.defer()
 
-    @discord.ui.button(label="Previous", emoji="⏮️", style=discord.ButtonStyle.secondary, row=0)
+    @discord.ui.button(label="Previous", emoji="⏮️", style=discord.ButtonStyle.secondary, row=0, custom_id='randotron:previous')
     async def previous(self, interaction: discord.Interaction, button: Button):
-        queue = get_queue(self.ctx.guild.id)
+        queue = get_queue(interaction.guild.id)
         prev = queue.get_previous()
         if prev:
-            if self.ctx.voice_client:
-                self.ctx.voice_client.stop()
+            if interaction.guild.voice_client:
+                interaction.guild.voice_client.stop()
         await interaction.response.defer()
 
-    @discord.ui.button(label="Stop", emoji="⏹️", style=discord.ButtonStyle.danger, row=0)
-    async def stop(self, interaction: discord.Interaction, button: Button):
-        if self.ctx.voice_client:
-            queue = get_queue(self.ctx.guild.id)
+    @discord.ui.button(label="Stop", emoji="⏹️", style=discord.ButtonStyle.danger, row=0, custom_id='randotron:stop')
+    async def stop_playback(self, interaction: discord.Interaction, button: Button):
+        if interaction.guild.voice_client:
+            cancel_import(interaction.guild.id)
+            queue = get_queue(interaction.guild.id)
             queue.clear()
-            self.ctx.voice_client.stop()
+            interaction.guild.voice_client.stop()
         await interaction.response.defer()
 
-    @discord.ui.button(label="Queue", emoji="📋", style=discord.ButtonStyle.secondary, row=1)
+    @discord.ui.button(label="Queue", emoji="📋", style=discord.ButtonStyle.secondary, row=1, custom_id='randotron:queue')
     async def show_queue(self, interaction: discord.Interaction, button: Button):
-        await self.bot.get_command('queue').callback(self.ctx)
+        await bot.get_command('queue').callback(ChannelContext(interaction.channel))
         await interaction.response.defer()
 
-    @discord.ui.button(label="Shuffle", emoji="🔀", style=discord.ButtonStyle.secondary, row=1)
+    @discord.ui.button(label="Shuffle", emoji="🔀", style=discord.ButtonStyle.secondary, row=1, custom_id='randotron:shuffle')
     async def shuffle(self, interaction: discord.Interaction, button: Button):
-        await self.bot.get_command('shuffle').callback(self.ctx)
+        await bot.get_command('shuffle').callback(ChannelContext(interaction.channel))
         await interaction.response.defer()
 
-    @discord.ui.button(label="Loop", emoji="🔁", style=discord.ButtonStyle.secondary, row=1)
+    @discord.ui.button(label="Loop", emoji="🔁", style=discord.ButtonStyle.secondary, row=1, custom_id='randotron:loop')
     async def loop(self, interaction: discord.Interaction, button: Button):
-        queue = get_queue(self.ctx.guild.id)
+        queue = get_queue(interaction.guild.id)
         queue.is_looping = not queue.is_looping
-        button.style = discord.ButtonStyle.success if queue.is_looping else discord.ButtonStyle.secondary
-        await interaction.response.edit_message(view=self)
+        await interaction.response.edit_message(view=self.render(queue, interaction.guild.voice_client))
+
+    async def change_volume(self, interaction, step):
+        voice_client = interaction.guild.voice_client
+        if voice_client and voice_client.source:
+            queue = get_queue(interaction.guild.id)
+            vol = max(0.0, min(1.0, round(voice_client.source.volume + step, 2)))
+            apply_volume(voice_client, queue, vol)
+            ctx = ChannelContext(interaction.channel)
+            await interaction.response.edit_message(embed=build_now_playing_embed(ctx), view=self.render(queue, voice_client))
+        else:
+            await interaction.response.defer()
 
-    @discord.ui.button(label="Vol +10%", emoji="🔊", style=discord.ButtonStyle.green, row=2)
+    @discord.ui.button(label="Vol +10%", emoji="🔊", style=discord.ButtonStyle.green, row=2, custom_id='randotron:volume_up')
     async def volume_up(self, interaction: discord.Interaction, button: Button):
-        if self.ctx.voice_client and self.ctx.voice_client.source:
-            vol = min(1.0, self.ctx.voice_client.source.volume + 0.1)
-            self.ctx.voice_client.source.volume = vol
-            await interaction.response.edit_message(embed=build_now_playing_embed(self.ctx), view=self)
+        await self.change_volume(interaction, 0.1)
 
-    @discord.ui.button(label="Vol -10%", emoji="🔉", style=discord.ButtonStyle.red, row=2)
+    @discord.ui.button(label="Vol -10%", emoji="🔉", style=discord.ButtonStyle.red, row=2, custom_id='randotron:volume_down')
     async def volume_down(self, interaction: discord.Interaction, button: Button):
-        if self.ctx.voice_client and self.ctx.voice_client.source:
-            vol = max(0.0, self.ctx.voice_client.source.volume - 0.1)
-            self.ctx.voice_client.source.volume = vol
-            await interaction.response.edit_message(embed=build_now_playing_embed(self.ctx), view=self)
+        await self.change_volume(interaction, -0.1)
 
-    @discord.ui.button(label="Add to Queue", emoji="➕", style=discord.ButtonStyle.blurple, row=3)
+    @discord.ui.button(label="Add to Queue", emoji="➕", style=discord.ButtonStyle.blurple, row=3, custom_id='randotron:add')
     async def add_to_queue(self, interaction: discord.Interaction, button: Button):
         await interaction.response.send_message(
             "**Add to Queue:**\n"
@@ -224,7 +1482,7 @@ class MusicControls(View):
             ephemeral=True  # Optional: Only you see it (less spam)
         )
 
-    @discord.ui.button(label="Play Next", emoji="⏭️", style=discord.ButtonStyle.blurple, row=3)
+    @discord.ui.button(label="Play Next", emoji="⏭️", style=discord.ButtonStyle.blurple, row=3, custom_id='randotron:play_next')
     async def play_next_btn(self, interaction: discord.Interaction, button: Button):
         await interaction.response.send_message(
             "**Play Next:**\n"
@@ -233,46 +1491,292 @@ class MusicControls(View):
             ephemeral=True  # Optional: Only you see it
         )
 
-def build_now_playing_embed(ctx):
-    queue = get_queue(ctx.guild.id)
-    if not queue.current:
-        return discord.Embed(title="❌ Nothing Playing", description="Use `!play` to start!", color=0xFF0000)
-    
-    duration = queue.current['duration'] if queue.current['duration'] else 0
-    elapsed = queue.elapsed
-    if ctx.voice_client.is_playing() and queue.start_time:
-        elapsed += time.time() - queue.start_time
+def playback_progress(ctx, queue):
+    """Rendered progress bar and time string for the current track"""
+    duration = queue.current.duration
+    elapsed = playback_position(queue, ctx.voice_client)
     
     progress = min(1, elapsed / duration) if duration > 0 else 0
     bar = "█" * int(10 * progress) + "░" * (10 - int(10 * progress))
     time_str = f"{int(elapsed // 60)}:{int(elapsed % 60):02d} / {duration // 60}:{duration % 60:02d}"
+    return bar, time_str
+
+class EmbedCache:
+    """Per-guild now-playing and queue embeds, rebuilt only when what they show has changed
+    
+    A now-playing embed is built once per track (title, thumbnail, duration, footer) and then only has its
+    queue/volume/progress fields patched. Queue pages are reused until the queue's version moves on.
+    """
+    def __init__(self):
+        self.now_playing = {}  # (guild id, style) -> (track, embed)
+        self.queue_pages = {}  # guild id -> ((queue version, current track), {page: embed})
     
-    embed = discord.Embed(title="🎵 Now Playing", description=f"**{queue.current['title']}**", color=0x1DB954)
-    embed.add_field(name="⏱️ Duration", value=f"{duration // 60}:{duration % 60:02d}", inline=True)
-    embed.add_field(name="📋 In Queue", value=f"{len(queue.queue)} songs", inline=True)
-    embed.add_field(name="🔊 Volume", value=f"{int(ctx.voice_client.source.volume * 100)}%" if ctx.voice_client else "N/A", inline=True)
-    embed.add_field(name="⏳ Progress", value=f"{bar} {time_str}", inline=False)
+    def forget(self, guild_id):
+        self.queue_pages.pop(guild_id, None)
+        for style in ('controls', 'np'):
+            self.now_playing.pop((guild_id, style), None)
     
-    if queue.current.get('thumbnail'):
-        embed.set_image(url=queue.current['thumbnail'])
+    def _track_embed(self, guild_id, track, style):
+        cached = self.now_playing.get((guild_id, style))
+        if cached and cached[0] is track:
+            return cached[1]
+        duration = f"{track.duration // 60}:{track.duration % 60:02d}"
+        embed = discord.Embed(title="🎵 Now Playing", description=f"**{track.title}**", color=0x1DB954)
+        embed.add_field(name="⏱️ Duration", value=duration, inline=True)
+        if style == 'controls':
+            embed.add_field(name="📋 In Queue", value="", inline=True)
+            embed.add_field(name="🔊 Volume", value="", inline=True)
+            embed.add_field(name="⏳ Progress", value="", inline=False)
+            embed.set_footer(text="⏯️ Pause/Play | ⏭️ Skip | ⏮️ Previous | ⏹️ Stop")
+        else:
+            embed.add_field(name="🔊 Volume", value="", inline=True)
+            embed.add_field(name="📋 Queue", value="", inline=True)
+            embed.set_footer(text="⏯️ !pause | ⏭️ !skip | ⏮️ !previous | ⏹️ !stop")
+        if track.thumbnail:
+            embed.set_image(url=track.thumbnail)
+        self.now_playing[(guild_id, style)] = (track, embed)
+        return embed
+    
+    def now_playing_embed(self, ctx, style='controls'):
+        """The now-playing embed: 'controls' for the message with buttons, 'np' for !np"""
+        queue = get_queue(ctx.guild.id)
+        if not queue.current:
+            description = "Use `!play` to start!" if style == 'controls' else "Use `!play` to start playing music!"
+            return discord.Embed(title="❌ Nothing Playing", description=description, color=0xFF0000)
+        
+        embed = self._track_embed(ctx.guild.id, queue.current, style)
+        voice_client = ctx.voice_client
+        volume = f"{int(voice_client.source.volume * 100)}%" if voice_client and voice_client.source else "N/A"
+        if style == 'controls':
+            bar, time_str = playback_progress(ctx, queue)
+            embed.set_field_at(1, name="📋 In Queue", value=f"{len(queue.queue)} songs", inline=True)
+            embed.set_field_at(2, name="🔊 Volume", value=volume, inline=True)
+            embed.set_field_at(3, name="⏳ Progress", value=f"{bar} {time_str}", inline=False)
+        else:
+            playing = voice_client and voice_client.is_playing()
+            embed.title = f"{'▶️' if playing else '⏸️'} Now Playing"
+            embed.set_field_at(1, name="🔊 Volume", value=volume, inline=True)
+            embed.set_field_at(2, name="📋 Queue", value=f"{len(queue.queue)} songs", inline=True)
+        return embed
+    
+    def queue_embed(self, guild_id, queue, page):
+        """One page of !queue, reused until the queue or the current track changes"""
+        pages = max(1, (len(queue.queue) + QUEUE_PAGE_SIZE - 1) // QUEUE_PAGE_SIZE)
+        page = max(1, min(page, pages))
+        key = (queue.queue.version, queue.current)
+        cached = self.queue_pages.get(guild_id)
+        if cached is None or cached[0][0] != key[0] or cached[0][1] is not key[1]:
+            cached = self.queue_pages[guild_id] = (key, {})
+        embed = cached[1].get(page)
+        if embed is None:
+            embed = cached[1][page] = self._build_queue_page(queue, page, pages)
+        return embed
     
-    embed.set_footer(text="⏯️ Pause/Play | ⏭️ Skip | ⏮️ Previous | ⏹️ Stop")
-    return embed
+    @staticmethod
+    def _build_queue_page(queue, page, pages):
+        if queue.is_empty() and not queue.current:
+            return discord.Embed(
+                title="📭 Queue is Empty",
+                description="No songs in queue! Use `!play` to add some music.",
+                color=0xFF0000
+            )
+        
+        embed = discord.Embed(title="🎵 Music Queue", color=0x1DB954)
+        
+        if queue.current:
+            duration = f"{queue.current.duration // 60}:{queue.current.duration % 60:02d}" if queue.current.duration else "?"
+            embed.add_field(
+                name="▶️ Now Playing", 
+                value=f"**{queue.current.title}** `[{duration}]`", 
+                inline=False
+            )
+            if queue.current.thumbnail:
+                embed.set_thumbnail(url=queue.current.thumbnail)
+        
+        if not queue.is_empty():
+            start = (page - 1) * QUEUE_PAGE_SIZE
+            queue_list = []
+            
+            for i, song in enumerate(queue.queue.page(start, QUEUE_PAGE_SIZE), start + 1):
+                duration = song.duration
+                duration_str = f"{duration // 60}:{duration % 60:02d}" if duration else "?"
+                queue_list.append(f"`{i}.` {song.title} `[{duration_str}]`")
+            
+            total_duration = queue.queue.total_duration
+            total_min = total_duration // 60
+            total_sec = total_duration % 60
+            
+            embed.add_field(
+                name=f"📋 Up Next • {len(queue.queue)} tracks • {total_min}:{total_sec:02d} total", 
+                value="\n".join(queue_list) if queue_list else "Empty",
+                inline=False
+            )
+            
+            if pages > 1:
+                embed.set_footer(text=f"Page {page}/{pages} • !queue <page> to see more")
+        return embed
 
-async def update_progress(ctx):
-    queue = get_queue(ctx.guild.id)
-    while ctx.voice_client and (ctx.voice_client.is_playing() or ctx.voice_client.is_paused()):
-        if queue.now_playing_msg:
-            await queue.now_playing_msg.edit(embed=build_now_playing_embed(ctx))
-        await asyncio.sleep(1)
-    queue.progress_task = None
-
-async def play_next(ctx):
-    """Play the next song in queue"""
+embed_cache = EmbedCache()
+
+def build_now_playing_embed(ctx):
+    return embed_cache.now_playing_embed(ctx)
+
+# Minimum seconds between edits of one now-playing message, and the cap on edits sent per tick
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '5'))
+PROGRESS_EDITS_PER_TICK = int(os.getenv('PROGRESS_EDITS_PER_TICK', '5'))
+# discord.py sits out 429s inside edit(), so a slow edit is the rate-limit signal; a stuck one is given up on
+PROGRESS_SLOW_EDIT = float(os.getenv('PROGRESS_SLOW_EDIT', '2'))
+PROGRESS_EDIT_TIMEOUT = float(os.getenv('PROGRESS_EDIT_TIMEOUT', '5'))
+
+class ProgressUpdater:
+    """One task that keeps every guild's now-playing message current without flooding Discord"""
+    def __init__(self):
+        self.watched = {}  # guild id -> {'ctx', 'message', 'state', 'next_edit'}
+        self.slowdown = 1.0  # Multiplies PROGRESS_INTERVAL; grows on slow/rate-limited edits and decays back afterwards
+        self.paused_until = 0.0
+        self.task = None
+    
+    def watch(self, ctx, message):
+        self.watched[ctx.guild.id] = {'ctx': ctx, 'message': message, 'state': None, 'next_edit': time.monotonic() + PROGRESS_INTERVAL}
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self.run())
+    
+    def forget(self, guild_id):
+        self.watched.pop(guild_id, None)
+    
+    def _state(self, ctx, queue):
+        # Everything the embed shows that can change while a track plays
+        volume = int(ctx.voice_client.source.volume * 100) if ctx.voice_client.source else None
+        return (id(queue.current), playback_progress(ctx, queue), volume, len(queue.queue))
+    
+    async def run(self):
+        while self.watched:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            if now < self.paused_until:
+                continue
+            
+            # Longest-waiting messages first so a capped tick doesn't starve anyone
+            due = sorted((entry['next_edit'], guild_id) for guild_id, entry in self.watched.items() if entry['next_edit'] <= now)
+            edits = []
+            for _, guild_id in due:
+                if len(edits) >= PROGRESS_EDITS_PER_TICK:
+                    break
+                entry = self.watched[guild_id]
+                ctx = entry['ctx']
+                queue = get_queue(guild_id)
+                if (queue.now_playing_msg is not entry['message'] or not queue.current or not ctx.voice_client
+                        or not (ctx.voice_client.is_playing() or ctx.voice_client.is_paused())):
+                    self.forget(guild_id)
+                    continue
+                
+                state = self._state(ctx, queue)
+                if state == entry['state']:
+                    continue  # Nothing visible changed (e.g. paused)
+                entry['next_edit'] = now + PROGRESS_INTERVAL * self.slowdown
+                edits.append(self._edit(guild_id, entry, state))
+            
+            # Sent together, so one guild stuck behind a rate limit doesn't hold up the rest
+            if any(await asyncio.gather(*edits)):
+                self.slowdown = min(self.slowdown * 2, 16.0)
+                self.paused_until = time.monotonic() + PROGRESS_INTERVAL * self.slowdown
+                log.warning("Progress updates rate limited, slowing down %.0fx", self.slowdown)
+            else:
+                self.slowdown = max(1.0, self.slowdown * 0.9)
+        self.task = None
+    
+    async def _edit(self, guild_id, entry, state):
+        """Edit one now-playing message, returning whether it looked rate limited (slow, stuck or a 429)"""
+        started = time.perf_counter()
+        try:
+            with metrics.timer('randotron_embed_edit_seconds'):
+                await asyncio.wait_for(entry['message'].edit(embed=build_now_playing_embed(entry['ctx'])), PROGRESS_EDIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.inc('randotron_errors_total', where='embed_edit')
+            return True
+        except discord.HTTPException as e:
+            metrics.inc('randotron_errors_total', where='embed_edit')
+            if e.status == 404:
+                self.forget(guild_id)  # Message was deleted
+            return e.status == 429
+        entry['state'] = state
+        return time.perf_counter() - started >= PROGRESS_SLOW_EDIT
+
+progress_updater = ProgressUpdater()
+
+class ChannelContext:
+    """Just enough of commands.Context for play_next when no command triggered it (e.g. auto-resume)"""
+    def __init__(self, channel):
+        self.channel = channel
+        self.guild = channel.guild
+    
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+    
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+async def resume_saved_sessions():
+    """Rejoin voice in every saved guild that was mid-track and start that track again"""
+    for guild_id in await queue_store.saved_guild_ids():
+        guild = bot.get_guild(guild_id)
+        if guild is None or guild.voice_client:
+            continue
+        queue = await load_queue(guild_id)
+        voice_channel = guild.get_channel(queue.voice_channel_id) if queue.voice_channel_id else None
+        text_channel = guild.get_channel(queue.text_channel_id) if queue.text_channel_id else None
+        if not queue.current or voice_channel is None or text_channel is None:
+            continue
+        try:
+            await voice_channel.connect()
+            queue.resume_at = queue.elapsed
+            queue.add_next(queue.current)
+            queue.current = None  # So get_next doesn't push it into history
+            await play_next(ChannelContext(text_channel))
+        except Exception as e:
+            log.warning("Auto-resume failed for guild %s: %r", guild_id, e)
+
+async def show_controls(ctx, queue):
+    """Put the current track on the guild's control message, editing it in place when it's in ctx's channel"""
+    embed = build_now_playing_embed(ctx)  # <--- CHANGED: Use new build function
+    view = MusicControls.render(queue, ctx.voice_client)
+    message = queue.now_playing_msg
+    if message is None and queue.control_message_id and queue.text_channel_id == ctx.channel.id:
+        message = ctx.channel.get_partial_message(queue.control_message_id)  # Left by a previous run
+    if message is not None and message.channel.id == ctx.channel.id:
+        try:
+            await message.edit(embed=embed, view=view)
+            return message
+        except discord.HTTPException:
+            pass  # Deleted, or an expired slash command response; post a fresh one
+    message = await ctx.send(embed=embed, view=view)
+    queue.control_message_id = message.id
+    return message
+
+async def play_next(ctx, replay=None):
+    """Play the next song in queue
+    
+    replay is an optional (track, resolved data) pair from a looped track, reused instead of resolving again.
+    """
     queue = get_queue(ctx.guild.id)
+    progress_updater.forget(ctx.guild.id)
     
-    if queue.progress_task:
-        queue.progress_task.cancel()
+    if ctx.guild.id in idle_reaper.leaving:
+        # The idle reaper stopped this player to leave voice; the queue waits for the next !p
+        idle_reaper.leaving.discard(ctx.guild.id)
+        if replay:
+            release_resolved(replay[1])
+        return
+    
+    if replay:
+        track, data = replay
+        if id(track) in queue.prefetched or queue.is_empty():
+            release_resolved(data)
+        else:
+            done = bot.loop.create_future()
+            done.set_result(data)
+            queue.prefetched[id(track)] = (track, done)
     
     if queue.is_empty():
         embed = discord.Embed(
@@ -286,51 +1790,396 @@ async def play_next(ctx):
     
     next_song = queue.get_next()
     if next_song:
+        started_at = time.perf_counter()
         try:
-            player = await YTDLSource.from_url(next_song['url'], loop=bot.loop)
+            resolving = take_prefetched(queue, next_song)
+            prefetch_upcoming(queue)
+            data = await resolving
+            start_at = queue.resume_at or 0
+            try:
+                player = make_player(data, start_at=start_at, volume=queue.volume)
+            except Exception:
+                release_resolved(data)
+                raise
+            player.started_at = started_at
+            source = MixingSource(player, queue, ctx, start_at=start_at, duration=next_song.duration) if GAPLESS_PLAYBACK else player
+            queue.mixer = source if GAPLESS_PLAYBACK else None
             
             def after_playing(error):
+                if queue.mixer is source:
+                    queue.mixer = None
                 queue.elapsed = 0
                 queue.start_time = None
-                if queue.progress_task:
-                    queue.progress_task.cancel()
-                try:
-                    if os.path.exists(player.filename):
-                        os.remove(player.filename)
-                except Exception as cleanup_err:
-                    print(f"Cleanup error: {repr(cleanup_err)}")
                 if error:
-                    print(f"Player error: {error}")
-                if queue.is_looping and queue.current:  # Re-add for loop
+                    metrics.inc('randotron_errors_total', where='player')
+                    log.error("Player error: %s", error)
+                replay = None
+                if queue.is_looping and queue.current:  # Re-add for loop, reusing what we already resolved
                     queue.add_next(queue.current)
-                asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop)
+                    replay = (queue.current, source.data)
+                else:
+                    release_resolved(source.data)  # The file stays cached for replays
+                asyncio.run_coroutine_threadsafe(play_next(ctx, replay), bot.loop)
             
-            ctx.voice_client.play(player, after=after_playing)
+            ctx.voice_client.play(source, after=after_playing)
             
-            queue.elapsed = 0
+            queue.elapsed = start_at
             queue.start_time = time.time()
+            queue.resume_at = None
             
-            embed = build_now_playing_embed(ctx)  # <--- CHANGED: Use new build function
-            view = MusicControls(bot, ctx)
-            msg = await ctx.send(embed=embed, view=view)
+            msg = await show_controls(ctx, queue)
             queue.now_playing_msg = msg
-            
-            queue.progress_task = bot.loop.create_task(update_progress(ctx))
+            queue.text_channel_id = ctx.channel.id
+            queue.voice_channel_id = ctx.voice_client.channel.id
+            progress_updater.watch(ctx, msg)
         except Exception as e:
-            print(f"Error playing track: {repr(e)}\n{traceback.format_exc()}")
+            metrics.inc('randotron_errors_total', where='playback')
+            log.exception("Error playing track")
             await ctx.send(f"❌ Error playing track, skipping to next...")
             await play_next(ctx)
 
+async def track_advanced(mixer, track, player, previous):
+    """Bookkeeping for a track a MixingSource switched to by itself: what play_next does when it starts one"""
+    queue = mixer.queue
+    ctx = mixer.ctx
+    release_resolved(previous.data)
+    progress_updater.forget(ctx.guild.id)
+    if queue.queue and queue.queue[0] is track:
+        queue.get_next()
+    else:  # The queue moved in the instant between the voice thread's check and now
+        if queue.current:
+            queue.history.append(queue.current)
+        queue.current = track
+    
+    # The lookahead's resolved data (and its cache reference) now belongs to the mixer's player
+    entry = queue.prefetched.pop(id(track), None)
+    if entry and not (entry[1].done() and not entry[1].cancelled() and not entry[1].exception() and entry[1].result() is player.data):
+        discard_prefetch(entry[1])
+    queue.elapsed = 0
+    queue.start_time = time.time()
+    prefetch_upcoming(queue)
+    
+    msg = await show_controls(ctx, queue)
+    queue.now_playing_msg = msg
+    progress_updater.watch(ctx, msg)
+
+# Leave voice after this long without playback, or this long with no human listeners in the channel
+IDLE_DISCONNECT_AFTER = float(os.getenv('IDLE_DISCONNECT_AFTER', '600'))
+ALONE_DISCONNECT_AFTER = float(os.getenv('ALONE_DISCONNECT_AFTER', '120'))
+# Drop a guild's MusicQueue from memory once it has had no voice connection for this long (it stays persisted)
+QUEUE_EVICT_AFTER = float(os.getenv('QUEUE_EVICT_AFTER', '1800'))
+REAPER_INTERVAL = 30
+
+class IdleReaper:
+    """Periodically disconnects idle/abandoned voice clients and evicts stale guild_queues entries"""
+    def __init__(self):
+        self.idle_since = {}  # guild id -> when playback last stopped
+        self.alone_since = {}  # guild id -> when the last human left the channel
+        self.last_connected = {}  # guild id -> last sweep that saw a voice connection
+        self.leaving = set()  # guild ids whose stopped player's play_next should stand down
+        self.task = None
+    
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self.run())
+    
+    async def run(self):
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception:
+                log.exception("Idle reaper error")
+    
+    async def sweep(self):
+        now = time.monotonic()
+        connected = set()
+        for voice_client in list(bot.voice_clients):
+            guild_id = voice_client.guild.id
+            connected.add(guild_id)
+            self.last_connected[guild_id] = now
+            
+            if voice_client.is_playing() or voice_client.is_paused():
+                self.idle_since.pop(guild_id, None)
+                idle_for = 0
+            else:
+                idle_for = now - self.idle_since.setdefault(guild_id, now)
+            
+            if any(not member.bot for member in voice_client.channel.members):
+                self.alone_since.pop(guild_id, None)
+                alone_for = 0
+            else:
+                alone_for = now - self.alone_since.setdefault(guild_id, now)
+            
+            if idle_for >= IDLE_DISCONNECT_AFTER:
+                await self.disconnect(voice_client, "nothing has played for a while")
+            elif alone_for >= ALONE_DISCONNECT_AFTER:
+                await self.disconnect(voice_client, "everyone left the channel")
+        
+        for guild_id in list(guild_queues):
+            if guild_id in connected:
+                continue
+            self.idle_since.pop(guild_id, None)
+            self.alone_since.pop(guild_id, None)
+            if now - self.last_connected.setdefault(guild_id, now) >= QUEUE_EVICT_AFTER:
+                queue = guild_queues.pop(guild_id)
+                cancel_import(guild_id)
+                queue.drop_prefetched()
+                progress_updater.forget(guild_id)
+                embed_cache.forget(guild_id)
+                spotify_resolve_limits.pop(guild_id, None)
+                self.last_connected.pop(guild_id, None)
+                await queue_store.evict(guild_id, queue)
+    
+    async def disconnect(self, voice_client, reason):
+        guild_id = voice_client.guild.id
+        self.idle_since.pop(guild_id, None)
+        self.alone_since.pop(guild_id, None)
+        queue = await load_queue(guild_id)
+        channel = bot.get_channel(queue.text_channel_id) if queue.text_channel_id else None
+        cancel_import(guild_id)
+        # Keep the queue: the track that was playing goes back to the front, to pick up where it left off
+        if queue.current:
+            queue.resume_at = playback_position(queue, voice_client)
+            queue.add_next(queue.current)
+            queue.current = None  # So the stopped player's after callback doesn't loop it
+        queue.drop_prefetched()
+        progress_updater.forget(guild_id)
+        if voice_client.is_playing() or voice_client.is_paused():
+            self.leaving.add(guild_id)
+        await voice_client.disconnect()
+        if channel:
+            try:
+                await channel.send(f"👋 Left {voice_client.channel.name} because {reason}")
+            except discord.HTTPException:
+                pass
+
+idle_reaper = IdleReaper()
+
+def guild_resources(guild_id):
+    """What one guild is currently holding: voice connection, FFmpeg processes and pinned cache bytes"""
+    guild = bot.get_guild(guild_id)
+    voice_client = guild.voice_client if guild else None
+    source = voice_client.source if voice_client else None
+    process = getattr(getattr(source, 'original', source), '_process', None)
+    queue = guild_queues.get(guild_id)
+    
+    # Cached files this guild holds references on: the playing track plus finished lookaheads
+    resolved = [source.data] if isinstance(source, PLAYER_TYPES) else []
+    if queue:
+        resolved += [task.result() for _, task in queue.prefetched.values()
+                     if task.done() and not task.cancelled() and not task.exception()]
+    cached_bytes = sum(audio_cache.size_of(data['id']) for data in resolved if downloaded_path(data))
+    
+    return {
+        'voice_clients': 1 if voice_client else 0,
+        'ffmpeg_processes': 1 if process and process.poll() is None else 0,
+        'cached_bytes': cached_bytes,
+        'queued_tracks': len(queue.queue) if queue else 0,
+        'prefetching': len(queue.prefetched) if queue else 0,
+    }
+
+def process_stats():
+    """This bot process's load, as reported over the control channel"""
+    usage = [guild_resources(guild_id) for guild_id in set(guild_queues) | {vc.guild.id for vc in bot.voice_clients}]
+    return {
+        'pid': os.getpid(),
+        'shards': sorted(getattr(bot, 'shards', None) or [bot.shard_id or 0]),
+        'guilds': len(bot.guilds),
+        'voice_clients': len(bot.voice_clients),
+        'queues': len(guild_queues),
+        'ffmpeg_processes': sum(item['ffmpeg_processes'] for item in usage),
+        'cached_bytes': audio_cache.total_bytes,
+        'latency_ms': round(bot.latency * 1000) if bot.latency == bot.latency else None,  # NaN before the first heartbeat
+        'reported_at': time.time(),
+    }
+
+class ClusterLink:
+    """A bot process's connection to the launcher's control channel (JSON lines over local TCP)"""
+    def __init__(self, index):
+        self.index = index
+        self.task = None
+    
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = bot.loop.create_task(self.run())
+    
+    async def run(self):
+        while True:
+            try:
+                _, writer = await asyncio.open_connection(CONTROL_HOST, CONTROL_PORT)
+                try:
+                    while True:
+                        report = {'op': 'report', 'process': self.index, 'stats': process_stats()}
+                        writer.write(json.dumps(report).encode() + b'\n')
+                        await writer.drain()
+                        await asyncio.sleep(CONTROL_REPORT_INTERVAL)
+                finally:
+                    writer.close()
+            except (OSError, ConnectionError) as e:
+                log.warning("Control channel unavailable (%r), retrying", e)
+                await asyncio.sleep(5)
+    
+    async def summary(self):
+        """Latest stats from every bot process, keyed by process index"""
+        reader, writer = await asyncio.open_connection(CONTROL_HOST, CONTROL_PORT)
+        try:
+            writer.write(b'{"op": "summary"}\n')
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), 5)
+        finally:
+            writer.close()
+        return json.loads(line)['processes']
+
+cluster_link = ClusterLink(BOT_PROCESS_INDEX) if BOT_PROCESS_INDEX is not None else None
+
+# Prometheus scrape endpoint (GET /metrics); bot process N listens on METRICS_PORT + N, and 0 turns it off
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+
+metrics.describe('randotron_voice_clients', 'gauge', "Connected voice clients")
+metrics.describe('randotron_queues_loaded', 'gauge', "Guild queues held in memory")
+metrics.describe('randotron_extractor_pending', 'gauge', "yt-dlp jobs queued or running")
+metrics.describe('randotron_audio_cache_bytes', 'gauge', "Bytes of downloaded audio on disk")
+metrics.collectors.update({
+    'randotron_cache_requests_total': lambda: [
+        ({'cache': 'search', 'result': 'hit'}, search_cache.hits), ({'cache': 'search', 'result': 'miss'}, search_cache.misses),
+        ({'cache': 'audio', 'result': 'hit'}, audio_cache.hits), ({'cache': 'audio', 'result': 'miss'}, audio_cache.misses),
+    ],
+    'randotron_voice_clients': lambda: [({}, len(bot.voice_clients))],
+    'randotron_queues_loaded': lambda: [({}, len(guild_queues))],
+    'randotron_extractor_pending': lambda: [({}, extractor.pending)],
+    'randotron_audio_cache_bytes': lambda: [({}, audio_cache.total_bytes)],
+})
+
+class MetricsServer:
+    """Serves metrics.render() over HTTP for a local Prometheus to scrape"""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.runner = None
+    
+    async def handle(self, request):
+        return web.Response(body=metrics.render().encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+    
+    async def start(self):
+        if self.runner is not None or not self.port:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+        except OSError as e:
+            log.warning("Metrics endpoint unavailable on %s:%d: %r", self.host, self.port, e)
+            await runner.cleanup()
+            return
+        self.runner = runner
+        log.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT + int(BOT_PROCESS_INDEX or 0) if METRICS_PORT else 0)
+
+# How often the loop's heartbeat ticks, and how far past due it has to be before the loop counts as stalled
+LAG_CHECK_INTERVAL = float(os.getenv('LAG_CHECK_INTERVAL', '0.1'))
+LAG_THRESHOLD = float(os.getenv('LAG_THRESHOLD', '0.25'))
+
+metrics.describe('randotron_loop_lag_seconds', 'histogram', "How late the event loop ran a timer that was due")
+metrics.describe('randotron_loop_stalls_total', 'counter', "Times the event loop was blocked for longer than LAG_THRESHOLD")
+
+class LoopWatchdog:
+    """Measures event-loop lag, and from a side thread grabs the loop thread's stack while it is blocked"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_tick = time.monotonic()
+        self.loop_thread_id = None
+        self.blocked = None  # The stall sampled since the last tick, until the loop gets going again
+        self.stalls = deque(maxlen=20)  # Most recent stalls: {'at', 'lag', 'task', 'stack'}
+        self.task = None
+        self.thread = None
+    
+    def start(self):
+        if self.task is None or self.task.done():
+            self.loop_thread_id = threading.get_ident()
+            self.last_tick = time.monotonic()
+            self.task = bot.loop.create_task(self.run())
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.watch, name='loop-watchdog', daemon=True)
+            self.thread.start()
+    
+    async def run(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(LAG_CHECK_INTERVAL)
+            now = time.monotonic()
+            lag = max(0.0, now - before - LAG_CHECK_INTERVAL)
+            metrics.observe('randotron_loop_lag_seconds', lag)
+            with self.lock:
+                self.last_tick = now
+                stall, self.blocked = self.blocked, None
+            if stall is not None:
+                stall['lag'] = lag
+                log.warning("Event loop blocked for %.0f ms in %s:\n%s", lag * 1000, stall['task'], stall['stack'])
+    
+    def watch(self):
+        while True:
+            time.sleep(LAG_CHECK_INTERVAL / 2)
+            with self.lock:
+                if self.blocked is not None or time.monotonic() - self.last_tick < LAG_CHECK_INTERVAL + LAG_THRESHOLD:
+                    continue
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is None:
+                    continue
+                self.blocked = {'at': time.time(), 'lag': None, 'task': self._running_task(), 'stack': self._format(frame)}
+                self.stalls.append(self.blocked)
+            metrics.inc('randotron_loop_stalls_total')
+    
+    @staticmethod
+    def _running_task():
+        task = asyncio.current_task(bot.loop)  # Just a dict lookup, so fine from another thread
+        if task is None:
+            return "a callback"
+        coro = task.get_coro()
+        return getattr(coro, '__qualname__', None) or task.get_name()
+    
+    @staticmethod
+    def _format(frame):
+        # Innermost frames are the interesting ones: the call that isn't yielding back to the loop
+        return '\n'.join(f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}\n    {entry.line or ''}"
+                         for entry in traceback.extract_stack(frame)[-8:])
+
+loop_watchdog = LoopWatchdog()
+
+resumed_sessions = False
+
+@bot.before_invoke
+async def load_guild_queue(ctx):
+    """Every command may touch the guild's queue, so make sure a saved one is loaded first"""
+    if ctx.guild:
+        await load_queue(ctx.guild.id)
+
 @bot.event
 async def on_ready():
-    print(f'{bot.user} is connected and ready!')
-    print('Note: This bot uses yt-dlp to search and play music from YouTube')
-    print("Opus loaded on ready:", discord.opus.is_loaded())
+    global resumed_sessions
+    log.info("%s is connected and ready!", bot.user)
+    log.info("Note: This bot uses yt-dlp to search and play music from YouTube")
+    log.info("Opus loaded on ready: %s", discord.opus.is_loaded())
     try:
         synced = await bot.tree.sync()  # <--- ADDED: Syncs global slash commands
-        print(f"Synced {len(synced)} slash command(s) globally!")
+        log.info("Synced %d slash command(s) globally!", len(synced))
     except Exception as e:
-        print(f"Sync error: {e}")
+        log.warning("Sync error: %s", e)
+    
+    bot.add_view(MusicControls())  # Routes button presses on any control message, including ones from before a restart
+    queue_store.start()
+    idle_reaper.start()
+    loop_watchdog.start()
+    await metrics_server.start()
+    if cluster_link:
+        cluster_link.start()
+    if AUTO_RESUME and not resumed_sessions:  # on_ready fires again after every reconnect
+        resumed_sessions = True
+        await resume_saved_sessions()
 
 
 @bot.command(name='join')
@@ -351,6 +2200,7 @@ async def join(ctx):
 async def leave(ctx):
     """Leave voice channel"""
     if ctx.voice_client:
+        cancel_import(ctx.guild.id)
         queue = get_queue(ctx.guild.id)
         queue.clear()
         await ctx.voice_client.disconnect()
@@ -374,55 +2224,271 @@ async def test_audio(ctx):
         await ctx.send("🔊 Playing test audio file...")
     except Exception as e:
         await ctx.send(f"❌ Error: {str(e)}")
-        print(f"Test audio error: {e}")
+        log.warning("Test audio error: %s", e)
 
-async def song_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
-    print(f"AUTOCOMPLETE TRIGGERED: current='{current}'")
-    
-    if len(current) < 3:
-        print("AUTOCOMPLETE: Query too short")
+# Suggestion endpoint behind /p autocomplete; point it at a local stub server for testing
+SUGGEST_URL = os.getenv('SUGGEST_URL', 'https://suggestqueries.google.com/complete/search')
+AUTOCOMPLETE_TIMEOUT = float(os.getenv('AUTOCOMPLETE_TIMEOUT', '2.0'))
+AUTOCOMPLETE_DEBOUNCE = float(os.getenv('AUTOCOMPLETE_DEBOUNCE', '0.15'))
+AUTOCOMPLETE_CACHE_SIZE = int(os.getenv('AUTOCOMPLETE_CACHE_SIZE', '5000'))
+SUGGESTION_LIMIT = 5  # Choices shown per keystroke; the cache keeps upstream's full list so longer prefixes can narrow it
+
+suggest_session = None  # Shared, pooled aiohttp session (created lazily inside the running loop)
+suggest_cache = OrderedDict()  # normalized prefix -> suggestions, least recently used first
+autocomplete_inflight = {}  # user id -> task fetching suggestions for their latest keystroke
+
+def get_suggest_session():
+    global suggest_session
+    if suggest_session is None or suggest_session.closed:
+        suggest_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=AUTOCOMPLETE_TIMEOUT),
+        )
+    return suggest_session
+
+async def fetch_youtube_suggestions(prefix):
+    params = {'client': 'youtube', 'ds': 'yt', 'q': prefix}
+    async with get_suggest_session().get(SUGGEST_URL, params=params) as resp:
+        if resp.status != 200:
+            return []
+        text = await resp.text()
+    start = text.find('(')
+    if start == -1:
         return []
+    data = json.loads(text[start+1:-1])
+    return [item[0] for item in data[1] if isinstance(item, list) and len(item) > 0] if len(data) > 1 else []
+
+async def fetch_spotify_suggestions(prefix):
+    # General Google suggestions (often Spotify-like for music)
+    params = {'client': 'firefox', 'q': f"{prefix} spotify"}
+    async with get_suggest_session().get(SUGGEST_URL, params=params) as resp:
+        if resp.status != 200:
+            return []
+        data = await resp.json(content_type=None)
+    if len(data) < 2:
+        return []
+    # Clean "song name spotify" → "song name"
+    return [sugg.replace(" spotify", "", 1).replace(" Spotify", "", 1) for sugg in data[1] if isinstance(sugg, str)]
+
+def cached_suggestions(prefix):
+    """Suggestions for prefix from the cache, narrowing the longest cached shorter prefix if needed"""
+    for end in range(len(prefix), 2, -1):
+        cached = suggest_cache.get(prefix[:end])
+        if cached is None:
+            continue
+        suggest_cache.move_to_end(prefix[:end])
+        if end == len(prefix):
+            return cached
+        return [sugg for sugg in cached if sugg.casefold().startswith(prefix)] or None
+    return None
+
+async def load_suggestions(prefix):
+    # Give the user a moment to keep typing; a newer keystroke cancels this task while it sleeps
+    await asyncio.sleep(AUTOCOMPLETE_DEBOUNCE)
     
-    async with aiohttp.ClientSession() as session:
+    # Ask both upstreams at once and only wait on the Google fallback if YouTube comes back empty
+    youtube = asyncio.ensure_future(fetch_youtube_suggestions(prefix))
+    google = asyncio.ensure_future(fetch_spotify_suggestions(prefix))
+    try:
+        suggestions = []
         try:
-            # YouTube suggestions (your current fast ones)
-            yt_url = "https://suggestqueries.google.com/complete/search"
-            yt_params = {'client': 'youtube', 'ds': 'yt', 'q': current}
-            async with session.get(yt_url, params=yt_params, timeout=2.0) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    start = text.find('(')
-                    if start != -1:
-                        json_text = text[start+1:-1]
-                        import json
-                        data = json.loads(json_text)
-                        if len(data) > 1:
-                            suggestions = [item[0] for item in data[1][:5] if isinstance(item, list) and len(item) > 0]
-                            choices = [app_commands.Choice(name=sugg[:100], value=sugg) for sugg in suggestions]
-                            print(f"AUTOCOMPLETE: Returning {len(choices)} YouTube suggestions")
-                            return choices
+            suggestions = await youtube
         except Exception as e:
-            print(f"AUTOCOMPLETE YouTube error: {repr(e)}")
-        
-        # Fallback: General Google suggestions (often Spotify-like for music)
+            metrics.inc('randotron_errors_total', where='autocomplete')
+            log.debug("Autocomplete YouTube error: %r", e)
+        if not suggestions:
+            try:
+                suggestions = await google
+            except Exception as e:
+                metrics.inc('randotron_errors_total', where='autocomplete')
+                log.debug("Autocomplete Google fallback error: %r", e)
+    finally:
+        youtube.cancel()
+        google.cancel()
+    
+    if suggestions:
+        suggest_cache[prefix] = suggestions
+        while len(suggest_cache) > AUTOCOMPLETE_CACHE_SIZE:
+            suggest_cache.popitem(last=False)
+    return suggestions
+
+async def song_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    prefix = SearchCache.normalize(current)
+    if len(prefix) < 3:
+        return []
+    
+    with metrics.timer('randotron_autocomplete_seconds'):
+        suggestions = await autocomplete_suggestions(interaction.user.id, prefix)
+    return [app_commands.Choice(name=sugg[:100], value=sugg) for sugg in suggestions[:SUGGESTION_LIMIT]]
+
+async def autocomplete_suggestions(user_id, prefix):
+    suggestions = cached_suggestions(prefix)
+    metrics.inc('randotron_cache_requests_total', cache='autocomplete', result='miss' if suggestions is None else 'hit')
+    if suggestions is None:
+        stale = autocomplete_inflight.pop(user_id, None)
+        if stale:
+            stale.cancel()
+        task = asyncio.ensure_future(load_suggestions(prefix))
+        autocomplete_inflight[user_id] = task
+        await asyncio.wait({task})
+        if autocomplete_inflight.get(user_id) is task:
+            del autocomplete_inflight[user_id]
+        if task.cancelled():
+            return []  # Superseded by a newer keystroke; Discord discards this response anyway
+        suggestions = task.result()
+    return suggestions
+
+async def spotify_single_page(track):
+    """A scraped single track shaped like SpotifyService.pages() output"""
+    if track:
+        yield [track]
+
+async def resolve_spotify_track(guild_id, track):
+    """Find the best YouTube match for a scraped Spotify track as a Track, or None"""
+    artist = track.get('artists', [{}])[0].get('name', '') if track.get('artists') else ''
+    title = track.get('name', '')
+    if not title:
+        return None
+    
+    # Known Spotify tracks map straight to their YouTube match; fall back to the search text
+    search_query = f"ytsearch:{artist} {title}"
+    key = f"spotify:{track['id']}" if track.get('id') else 'yt:' + SearchCache.normalize(f"{artist} {title}")
+    info = await search_cache.get(key) or await search_flights.run(key, lambda: _resolve_spotify_track(guild_id, search_query, key))
+    return Track.from_dict(info) if info else None
+
+async def _resolve_spotify_track(guild_id, search_query, key):
+    limit = spotify_resolve_limits.setdefault(guild_id, asyncio.Semaphore(SPOTIFY_RESOLVE_PER_GUILD))
+    try:
+        async with limit:
+            yt_data = await extractor.extract(search_query, download=False)
+    except Exception as e:
+        metrics.inc('randotron_errors_total', where='spotify')
+        log.warning("Spotify lookup failed for %r: %r", search_query, e)
+        return None
+    
+    valid_entries = [e for e in yt_data.get('entries') or [] if e and (e.get('duration') or 0) > 60]
+    if not valid_entries:
+        return None
+    info = Track.from_entry(max(valid_entries, key=lambda x: x.get('duration', 0))).to_dict()
+    search_cache.put(key, info)
+    return info
+
+# Playlist pages fetched per YouTube request, and the minimum seconds between edits of an import's progress message
+YOUTUBE_PLAYLIST_PAGE_SIZE = int(os.getenv('YOUTUBE_PLAYLIST_PAGE_SIZE', '100'))
+IMPORT_PROGRESS_INTERVAL = float(os.getenv('IMPORT_PROGRESS_INTERVAL', '3'))
+
+YOUTUBE_PLAYLIST_RE = re.compile(r'youtube\.com/playlist\?(?:.*&)?list=[\w-]+')
+
+async def spotify_import(guild_id, kind, url):
+    """Yield a Track (or None when YouTube has no match) for each track behind a Spotify URL, in order"""
+    pages = spotify_single_page(await spotify.info('track', url)) if kind == 'track' else spotify.pages(kind, url)
+    async for page in pages:
+        # Each page's searches run concurrently, but results come out in playlist order
+        lookups = [bot.loop.create_task(resolve_spotify_track(guild_id, track)) for track in page]
         try:
-            google_url = "https://suggestqueries.google.com/complete/search"
-            google_params = {'client': 'firefox', 'q': f"{current} spotify"}
-            async with session.get(google_url, params=google_params, timeout=2.0) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    if len(data) > 1:
-                        suggestions = [sugg for sugg in data[1][:5] if isinstance(sugg, str)]
-                        # Clean "song name spotify" → "song name"
-                        clean_suggestions = [sugg.replace(" spotify", "", 1).replace(" Spotify", "", 1) for sugg in suggestions]
-                        choices = [app_commands.Choice(name=sugg[:100], value=sugg) for sugg in clean_suggestions]
-                        print(f"AUTOCOMPLETE: Returning {len(choices)} Spotify-like suggestions")
-                        return choices
-        except Exception as e:
-            print(f"AUTOCOMPLETE Google fallback error: {repr(e)}")
+            for lookup in lookups:
+                yield await lookup
+        finally:
+            for lookup in lookups:
+                lookup.cancel()
+
+async def youtube_playlist_import(url):
+    """Yield a Track (or None for deleted/private videos) for each video of a YouTube playlist, page by page"""
+    start = 1
+    while True:
+        data = await extractor.playlist_page(url, start, YOUTUBE_PLAYLIST_PAGE_SIZE)
+        entries = data.get('entries') or []
+        for entry in entries:
+            available = entry and entry.get('url') and entry.get('title') not in ('[Deleted video]', '[Private video]')
+            yield Track.from_entry(entry) if available else None
+        if len(entries) < YOUTUBE_PLAYLIST_PAGE_SIZE:
+            return
+        start += YOUTUBE_PLAYLIST_PAGE_SIZE
+
+class ImportJob:
+    """A playlist/album being added to one guild's queue in the background, reported through one edited message"""
+    def __init__(self, ctx, label, message):
+        self.ctx = ctx
+        self.label = label
+        self.message = message
+        self.added = 0
+        self.skipped = 0
+        self.next_edit = time.monotonic() + IMPORT_PROGRESS_INTERVAL
+        self.task = None
+    
+    async def report(self, text=None):
+        """Edit the progress message, at most every IMPORT_PROGRESS_INTERVAL unless text is the final word"""
+        if text is None:
+            if time.monotonic() < self.next_edit:
+                return
+            text = f"📥 Importing {self.label}... {self.added} added so far"
+        self.next_edit = time.monotonic() + IMPORT_PROGRESS_INTERVAL
+        try:
+            await self.message.edit(content=text)
+        except discord.HTTPException as e:
+            if e.status not in (401, 404):
+                return
+            # Deleted, or a slash command response whose interaction token expired: carry on in a fresh message
+            try:
+                self.message = await self.ctx.channel.send(text)
+            except discord.HTTPException:
+                pass
     
-    print("AUTOCOMPLETE: No suggestions, returning empty")
-    return []
+    async def run(self, tracks):
+        queue = get_queue(self.ctx.guild.id)
+        try:
+            async for song in tracks:
+                if self.ctx.voice_client is None:
+                    await self.report(f"⏹️ Stopped importing {self.label} after {self.added} tracks: left voice")
+                    return
+                if song is None:
+                    self.skipped += 1
+                    continue
+                queue.add(song)
+                self.added += 1
+                prefetch_upcoming(queue)
+                
+                # Start playback on the very first successful add. Playback is its own task: cancelling the
+                # import mustn't interrupt play_next after it has taken the track off the queue.
+                if self.added == 1 and not (self.ctx.voice_client.is_playing() or self.ctx.voice_client.is_paused()):
+                    bot.loop.create_task(play_next(self.ctx))
+                await self.report()
+            
+            if not self.added and not self.skipped:
+                await self.report("❌ No tracks found or URL is private/restricted.")
+            else:
+                await self.report(f"✅ Added {self.added} tracks from {self.label}! (Skipped {self.skipped} due to no matches)")
+        except asyncio.CancelledError:
+            await self.report(f"🛑 Import of {self.label} cancelled after {self.added} tracks")
+            raise
+        except Exception as e:
+            metrics.inc('randotron_errors_total', where='import')
+            log.exception("Import of %s failed", self.label)
+            await self.report(f"❌ Import of {self.label} failed after {self.added} tracks: {e}")
+        finally:
+            await tracks.aclose()
+            if guild_imports.get(self.ctx.guild.id) is self:
+                del guild_imports[self.ctx.guild.id]
+
+guild_imports = {}  # guild id -> the ImportJob currently running there
+
+async def start_import(ctx, label, tracks):
+    """Run an import job for ctx's guild in the background, unless one is already going"""
+    running = guild_imports.get(ctx.guild.id)
+    if running:
+        await tracks.aclose()
+        await ctx.send(f"❌ Still importing {running.label} ({running.added} added so far). Use `!cancelimport` to stop it first.")
+        return
+    message = await ctx.send(f"📥 Importing {label}...")
+    job = guild_imports[ctx.guild.id] = ImportJob(ctx, label, message)
+    job.task = bot.loop.create_task(job.run(tracks))
+
+def cancel_import(guild_id):
+    """Cancel the guild's running import, returning its job (or None if there wasn't one)"""
+    job = guild_imports.pop(guild_id, None)
+    if job:
+        job.task.cancel()
+    return job
 
 @bot.hybrid_command(name="p", description="Play a song from YouTube/Spotify", aliases=["play"])
 @app_commands.describe(query="Song name, YouTube/Spotify URL, or search query")
@@ -436,105 +2502,51 @@ async def play(ctx: commands.Context, *, query: str):
             await ctx.send("❌ You need to be in a voice channel!")
             return
     
+    if 'spotify.com' in query:  # <--- UPDATED: Scrape with spotifyscraper
+        spotify_url = query.split('?')[0]  # Strip params
+        spotify_type = next((kind for kind in ('track', 'playlist', 'album') if f'/{kind}/' in spotify_url), None)
+        if spotify_type is None:
+            await ctx.send("❌ Invalid Spotify URL. Supports tracks, playlists, and albums.")
+            return
+        await start_import(ctx, f"Spotify {spotify_type}", spotify_import(ctx.guild.id, spotify_type, spotify_url))
+        return
+    if YOUTUBE_PLAYLIST_RE.search(query):
+        await start_import(ctx, "YouTube playlist", youtube_playlist_import(query))
+        return
+    
     async with ctx.typing():
         try:
-            queue = get_queue(ctx.guild.id)
-            if 'spotify.com' in query:  # <--- UPDATED: Scrape with spotifyscraper
-                await ctx.send("🔍 Scraping from Spotify (no API needed)...")
-                client = SpotifyClient()
+            # Search YouTube
+            song = await search_youtube(query)
+            
+            if song:
+                queue = get_queue(ctx.guild.id)
+                queue.add(song)
                 
-                spotify_type = None
-                spotify_url = query.split('?')[0]  # Strip params
-                if '/track/' in spotify_url:
-                    spotify_type = 'track'
-                    data = client.get_track_info(spotify_url)
-                    tracks = [data] if data else []
-                elif '/playlist/' in spotify_url:
-                    spotify_type = 'playlist'
-                    data = client.get_playlist_info(spotify_url)
-                    tracks = data.get('tracks', [])[:100]  # Limit to 100 to avoid overload; adjust as needed
-                elif '/album/' in spotify_url:
-                    spotify_type = 'album'
-                    data = client.get_album_info(spotify_url)
-                    tracks = data.get('tracks', [])[:100]
+                if not ctx.voice_client.is_playing():
+                    await play_next(ctx)
                 else:
-                    await ctx.send("❌ Invalid Spotify URL. Supports tracks, playlists, and albums.")
-                    client.close()
-                    return
-                
-                if not tracks:
-                        await ctx.send("❌ No tracks found or URL is private/restricted.")
-                        client.close()
-                        return
-
-                added = 0
-                skipped = 0
-                started_playback = False
-
-                for track in tracks:
-                    artist = track.get('artists', [{}])[0].get('name', '') if track.get('artists') else ''
-                    title = track.get('name', '')
-                    if not title:
-                        skipped += 1
-                        continue
-                    
-                    search_query = f"ytsearch:{artist} {title}"
-                    yt_data = await bot.loop.run_in_executor(None, lambda: ytdl.extract_info(search_query, download=False))
-                    
-                    if 'entries' in yt_data and yt_data['entries']:
-                        valid_entries = [e for e in yt_data['entries'] if e and e.get('duration', 0) > 60]
-                        if valid_entries:
-                            yt_entry = sorted(valid_entries, key=lambda x: x.get('duration', 0), reverse=True)[0]
-                            song_info = {
-                                'url': yt_entry.get('webpage_url'),
-                                'title': yt_entry.get('title'),
-                                'duration': yt_entry.get('duration'),
-                                'thumbnail': yt_entry.get('thumbnail')
-                            }
-                            queue.add(song_info)
-                            added += 1
-
-                            # Start playback on the very first successful add
-                            if not started_playback and not ctx.voice_client.is_playing():
-                                await play_next(ctx)
-                                started_playback = True
-                        else:
-                            skipped += 1
-                    else:
-                        skipped += 1
-
-                client.close()
-                
-                await ctx.send(f"✅ Added {added} tracks from Spotify {spotify_type}! (Skipped {skipped} due to no matches)")
+                    prefetch_upcoming(queue)
+                    await ctx.send(f"✅ Added to queue: **{song.title}**")
             else:
-                # Search YouTube
-                search_query = f"ytsearch:{query}"
-                # Change download=False to extract metadata only
-                data = await bot.loop.run_in_executor(None, lambda: ytdl.extract_info(search_query, download=False))
-                
-                if 'entries' in data and data['entries']:
-                    data = data['entries'][0]
-                    
-                    queue = get_queue(ctx.guild.id)
-                    queue.add({
-                        'url': data.get('webpage_url'), # Use the YouTube link, not the raw stream link
-                        'title': data.get('title'),
-                        'duration': data.get('duration'),
-                        'thumbnail': data.get('thumbnail')
-                    })
-                    
-                    if not ctx.voice_client.is_playing():
-                        await play_next(ctx)
-                    else:
-                        await ctx.send(f"✅ Added to queue: **{data.get('title')}**")
-                else:
-                    await ctx.send("❌ No results found")
+                await ctx.send("❌ No results found")
         except Exception as e:
+            metrics.inc('randotron_errors_total', where='command')
+            log.exception("play failed for %r", query)
             await ctx.send(f"❌ Error: {str(e)}")
 
 
 
 
+@bot.command(name='cancelimport')
+async def cancel_import_command(ctx):
+    """Stop adding tracks from a running playlist/album import"""
+    job = cancel_import(ctx.guild.id)
+    if job:
+        await ctx.send(f"🛑 Cancelled import of {job.label} ({job.added} tracks were added)")
+    else:
+        await ctx.send("❌ No import is running")
+
 @bot.command(name='pause')
 async def pause(ctx):
     """Pause playback"""
@@ -561,6 +2573,7 @@ async def resume(ctx):
 async def stop(ctx):
     """Stop playback and clear queue"""
     if ctx.voice_client:
+        cancel_import(ctx.guild.id)
         queue = get_queue(ctx.guild.id)
         queue.clear()
         ctx.voice_client.stop()
@@ -577,6 +2590,35 @@ async def skip(ctx):
     else:
         await ctx.send("❌ Nothing is playing")
 
+def parse_timestamp(text):
+    """'90', '1:30' or '1:02:03' -> seconds, or None if it isn't a timestamp"""
+    parts = text.split(':')
+    if not 1 <= len(parts) <= 3 or not all(part.isdigit() for part in parts):
+        return None
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+@bot.command(name='seek')
+async def seek(ctx, position: str):
+    """Jump to a position in the current track (mm:ss)"""
+    queue = get_queue(ctx.guild.id)
+    voice_client = ctx.voice_client
+    source = voice_client.source if voice_client else None
+    if not queue.current or not isinstance(source, PLAYER_TYPES):
+        await ctx.send("❌ Nothing is playing")
+        return
+    
+    offset = parse_timestamp(position)
+    if offset is None or (queue.current.duration and offset >= queue.current.duration):
+        await ctx.send("❌ Give a position like `1:30` within the track")
+        return
+    
+    # Restart FFmpeg on the already-resolved file/stream at the new offset
+    restart_player(voice_client, queue, offset)
+    await ctx.send(f"⏩ Seeked to **{offset // 60}:{offset % 60:02d}**")
+
 @bot.command(name='previous')
 async def previous(ctx):
     """Go back to previous track"""
@@ -586,80 +2628,28 @@ async def previous(ctx):
     if prev:
         queue.current = prev  # Set directly for play_next
         await play_next(ctx)  # <--- CHANGED: Call play_next to handle embed/view/progress
-        await ctx.send(f"⏮️ Playing previous: **{prev['title']}**")
+        await ctx.send(f"⏮️ Playing previous: **{prev.title}**")
     else:
         await ctx.send("❌ No previous track in history")
 
 @bot.command(name='queue')
-async def show_queue(ctx):
-    """Show current queue"""
-    queue = get_queue(ctx.guild.id)
-    
-    if queue.is_empty() and not queue.current:
-        embed = discord.Embed(
-            title="📭 Queue is Empty",
-            description="No songs in queue! Use `!play` to add some music.",
-            color=0xFF0000
-        )
-        await ctx.send(embed=embed)
-        return
-    
-    embed = discord.Embed(title="🎵 Music Queue", color=0x1DB954)
-    
-    if queue.current:
-        duration = f"{queue.current['duration'] // 60}:{queue.current['duration'] % 60:02d}" if queue.current['duration'] else "?"
-        embed.add_field(
-            name="▶️ Now Playing", 
-            value=f"**{queue.current['title']}** `[{duration}]`", 
-            inline=False
-        )
-        if queue.current.get('thumbnail'):
-            embed.set_thumbnail(url=queue.current['thumbnail'])
-    
-    if not queue.is_empty():
-        queue_list = []
-        total_duration = 0
-        
-        for i, song in enumerate(list(queue.queue)[:10], 1):
-            duration = song['duration'] if song['duration'] else 0
-            total_duration += duration
-            duration_str = f"{duration // 60}:{duration % 60:02d}" if duration else "?"
-            queue_list.append(f"`{i}.` {song['title']} `[{duration_str}]`")
-        
-        total_min = total_duration // 60
-        total_sec = total_duration % 60
-        
-        embed.add_field(
-            name=f"📋 Up Next • {len(queue.queue)} tracks • {total_min}:{total_sec:02d} total", 
-            value="\n".join(queue_list) if queue_list else "Empty",
-            inline=False
-        )
-        
-        if len(queue.queue) > 10:
-            embed.set_footer(text=f"+ {len(queue.queue) - 10} more songs in queue")
-    
-    await ctx.send(embed=embed)
+async def show_queue(ctx, page: int = 1):
+    """Show current queue (optionally a later page)"""
+    await ctx.send(embed=embed_cache.queue_embed(ctx.guild.id, get_queue(ctx.guild.id), page))
 
 @bot.command(name='playnext')
 async def play_next_command(ctx, *, query: str):
     """Add a song to play next in queue"""
     async with ctx.typing():
         try:
-            search_query = f"ytsearch:{query}"
-            data = await bot.loop.run_in_executor(None, lambda: ytdl.extract_info(search_query, download=False))
+            song = await search_youtube(query)
             
-            if 'entries' in data and data['entries']:
-                data = data['entries'][0]
-                
+            if song:
                 queue = get_queue(ctx.guild.id)
-                queue.add_next({
-                    'url': data.get('url') or data.get('webpage_url'),
-                    'title': data.get('title'),
-                    'duration': data.get('duration'),
-                    'thumbnail': data.get('thumbnail')
-                })
+                queue.add_next(song)
+                prefetch_upcoming(queue)
                 
-                await ctx.send(f"⏩ Added to play next: **{data.get('title')}**")
+                await ctx.send(f"⏩ Added to play next: **{song.title}**")
             else:
                 await ctx.send("❌ No results found")
         except Exception as e:
@@ -668,20 +2658,18 @@ async def play_next_command(ctx, *, query: str):
 @bot.command(name='shuffle')
 async def shuffle(ctx):
     """Shuffle the current queue"""
-    import random
     queue = get_queue(ctx.guild.id)
     
     if queue.is_empty():
         await ctx.send("❌ Queue is empty!")
         return
     
-    queue_list = list(queue.queue)
-    random.shuffle(queue_list)
-    queue.queue = deque(queue_list)
+    queue.queue.shuffle()
+    prefetch_upcoming(queue)
     
     embed = discord.Embed(
         title="🔀 Queue Shuffled",
-        description=f"Shuffled {len(queue_list)} songs!",
+        description=f"Shuffled {len(queue.queue)} songs!",
         color=0x1DB954
     )
     await ctx.send(embed=embed)
@@ -708,7 +2696,7 @@ async def lyrics(ctx):
     
     embed = discord.Embed(
         title="📝 Lyrics",
-        description=f"Search for lyrics: **{queue.current['title']}**\n\n[Search on Genius](https://genius.com/search?q={queue.current['title'].replace(' ', '%20')})",
+        description=f"Search for lyrics: **{queue.current.title}**\n\n[Search on Genius](https://genius.com/search?q={queue.current.title.replace(' ', '%20')})",
         color=0x1DB954
     )
     await ctx.send(embed=embed)
@@ -717,8 +2705,10 @@ async def lyrics(ctx):
 async def clear_queue(ctx):
     """Clear all songs from queue"""
     queue = get_queue(ctx.guild.id)
+    cancel_import(ctx.guild.id)
     queue_size = len(queue.queue)
     queue.queue.clear()
+    queue.drop_prefetched()
     
     embed = discord.Embed(
         title="🗑️ Queue Cleared",
@@ -736,23 +2726,42 @@ async def remove(ctx, position: int):
         await ctx.send(f"❌ Invalid position! Queue has {len(queue.queue)} songs.")
         return
     
-    queue_list = list(queue.queue)
-    removed = queue_list.pop(position - 1)
-    queue.queue = deque(queue_list)
+    removed = queue.queue.pop(position - 1)
+    prefetch_upcoming(queue)
     
     embed = discord.Embed(
         title="➖ Removed from Queue",
-        description=f"Removed: **{removed['title']}**",
+        description=f"Removed: **{removed.title}**",
         color=0xFF6B6B
     )
     await ctx.send(embed=embed)
 
+@bot.command(name='move')
+async def move(ctx, source: int, destination: int):
+    """Move a song in the queue to a new position"""
+    queue = get_queue(ctx.guild.id)
+    size = len(queue.queue)
+    
+    if not (1 <= source <= size and 1 <= destination <= size):
+        await ctx.send(f"❌ Invalid position! Queue has {size} songs.")
+        return
+    
+    moved = queue.queue.move(source - 1, destination - 1)
+    prefetch_upcoming(queue)
+    
+    embed = discord.Embed(
+        title="↕️ Moved in Queue",
+        description=f"Moved **{moved.title}** to position {destination}",
+        color=0x1DB954
+    )
+    await ctx.send(embed=embed)
+
 @bot.command(name='stats')
 async def stats(ctx):
     """Show bot statistics"""
     queue = get_queue(ctx.guild.id)
     
-    total_duration = sum(song.get('duration', 0) for song in queue.queue)
+    total_duration = queue.queue.total_duration
     hours = total_duration // 3600
     minutes = (total_duration % 3600) // 60
     
@@ -763,7 +2772,77 @@ async def stats(ctx):
     embed.add_field(name="📜 History", value=len(queue.history), inline=True)
     embed.add_field(name="🎧 Voice Channel", value=ctx.voice_client.channel.name if ctx.voice_client else "Not connected", inline=True)
     embed.add_field(name="👥 Listeners", value=len(ctx.voice_client.channel.members) - 1 if ctx.voice_client else 0, inline=True)
+    embed.add_field(name="🔎 Search Cache", value=f"{search_cache.hits} hits / {search_cache.misses} misses", inline=True)
+    embed.add_field(name="💾 Audio Cache", value=f"{audio_cache.hits} hits / {audio_cache.misses} misses • {audio_cache.total_bytes // (1024 * 1024)} MB", inline=True)
+    embed.add_field(name="🔍 Extraction", value=metrics.summary('randotron_extract_seconds'), inline=True)
+    embed.add_field(name="⬇️ Download", value=metrics.summary('randotron_download_seconds'), inline=True)
+    embed.add_field(name="🎬 First Frame", value=metrics.summary('randotron_first_frame_seconds'), inline=True)
+    embed.add_field(name="✏️ Embed Edits", value=metrics.summary('randotron_embed_edit_seconds'), inline=True)
+    embed.add_field(name="⌨️ Autocomplete", value=metrics.summary('randotron_autocomplete_seconds'), inline=True)
+    embed.add_field(name="⚠️ Errors", value=metrics.total('randotron_errors_total'), inline=True)
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name='resources')
+async def resources(ctx):
+    """Show voice/FFmpeg/cache resources held by this server and by the whole bot"""
+    mine = guild_resources(ctx.guild.id)
+    totals = {key: 0 for key in mine}
+    for guild_id in set(guild_queues) | {vc.guild.id for vc in bot.voice_clients}:
+        for key, value in guild_resources(guild_id).items():
+            totals[key] += value
+    
+    def describe(usage):
+        return (f"🎧 Voice clients: {usage['voice_clients']}\n"
+                f"⚙️ FFmpeg processes: {usage['ffmpeg_processes']}\n"
+                f"💾 Pinned cache: {usage['cached_bytes'] // (1024 * 1024)} MB\n"
+                f"📋 Queued tracks: {usage['queued_tracks']} ({usage['prefetching']} prefetching)")
+    
+    embed = discord.Embed(title="🧮 Resource Usage", color=0x1DB954)
+    embed.add_field(name="This Server", value=describe(mine), inline=True)
+    embed.add_field(name=f"All Servers ({len(guild_queues)} queues loaded)", value=describe(totals), inline=True)
+    embed.set_footer(text=f"Audio cache on disk: {audio_cache.total_bytes // (1024 * 1024)} MB of {AUDIO_CACHE_BYTES // (1024 * 1024)} MB")
+    await ctx.send(embed=embed)
+
+@bot.command(name='lag')
+async def lag(ctx):
+    """Show event-loop lag and where the loop was stuck in the most recent stalls"""
+    embed = discord.Embed(title="🐢 Event Loop Lag", color=0x1DB954)
+    embed.add_field(name="⏱️ Lag", value=metrics.summary('randotron_loop_lag_seconds'), inline=True)
+    embed.add_field(name="🧱 Stalls", value=f"{metrics.total('randotron_loop_stalls_total')} over {LAG_THRESHOLD * 1000:.0f} ms", inline=True)
+    
+    recent = list(loop_watchdog.stalls)[-3:]
+    for stall in reversed(recent):
+        blocked_for = f"{stall['lag'] * 1000:.0f} ms" if stall['lag'] is not None else "Still blocked"
+        embed.add_field(
+            name=f"{blocked_for} in {stall['task']} • {int(time.time() - stall['at'])}s ago",
+            value=f"```{stall['stack'][-1000:]}```",
+            inline=False
+        )
+    if not recent:
+        embed.set_footer(text="No stalls recorded since startup")
+    await ctx.send(embed=embed)
+
+@bot.command(name='cluster')
+async def cluster(ctx):
+    """Show load across every bot process/shard"""
+    try:
+        processes = await cluster_link.summary() if cluster_link else {'0': process_stats()}
+    except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+        await ctx.send(f"❌ Control channel unavailable: {e}")
+        return
     
+    embed = discord.Embed(title="🛰️ Cluster Status", color=0x1DB954)
+    for index, stats in sorted(processes.items(), key=lambda item: int(item[0])):
+        age = int(time.time() - stats['reported_at'])
+        embed.add_field(
+            name=f"Process {index} • shards {', '.join(map(str, stats['shards']))}",
+            value=(f"🏠 {stats['guilds']} servers • 🎧 {stats['voice_clients']} voice • ⚙️ {stats['ffmpeg_processes']} FFmpeg\n"
+                   f"📋 {stats['queues']} queues • 📶 {stats['latency_ms']} ms • reported {age}s ago"),
+            inline=False
+        )
+    embed.set_footer(text=f"Total: {sum(stats['guilds'] for stats in processes.values())} servers, "
+                          f"{sum(stats['voice_clients'] for stats in processes.values())} voice connections")
     await ctx.send(embed=embed)
 
 @bot.command(name='volume')
@@ -774,7 +2853,7 @@ async def volume(ctx, vol: int):
         return
     
     if 0 <= vol <= 100:
-        ctx.voice_client.source.volume = vol / 100
+        apply_volume(ctx.voice_client, get_queue(ctx.guild.id), vol / 100)
         
         # Visual volume indicator
         bars = "█" * (vol // 10) + "░" * (10 - vol // 10)
@@ -791,40 +2870,7 @@ async def volume(ctx, vol: int):
 @bot.command(name='np')
 async def now_playing(ctx):
     """Show currently playing track with progress bar"""
-    queue = get_queue(ctx.guild.id)
-    
-    if queue.current:
-        duration = queue.current['duration'] if queue.current['duration'] else 0
-        duration_min = duration // 60
-        duration_sec = duration % 60
-        
-        # Create a visual progress bar (simplified since we don't track exact position)
-        status_emoji = "▶️" if ctx.voice_client and ctx.voice_client.is_playing() else "⏸️"
-        
-        embed = discord.Embed(
-            title=f"{status_emoji} Now Playing",
-            description=f"**{queue.current['title']}**",
-            color=0x1DB954
-        )
-        
-        embed.add_field(name="⏱️ Duration", value=f"{duration_min}:{duration_sec:02d}", inline=True)
-        embed.add_field(name="🔊 Volume", value=f"{int(ctx.voice_client.source.volume * 100)}%" if ctx.voice_client else "N/A", inline=True)
-        embed.add_field(name="📋 Queue", value=f"{len(get_queue(ctx.guild.id).queue)} songs", inline=True)
-        
-        if queue.current.get('thumbnail'):
-            embed.set_image(url=queue.current['thumbnail'])
-        
-        # Add controls hint
-        embed.set_footer(text="⏯️ !pause | ⏭️ !skip | ⏮️ !previous | ⏹️ !stop")
-        
-        await ctx.send(embed=embed)
-    else:
-        embed = discord.Embed(
-            title="❌ Nothing Playing",
-            description="Use `!play` to start playing music!",
-            color=0xFF0000
-        )
-        await ctx.send(embed=embed)
+    await ctx.send(embed=embed_cache.now_playing_embed(ctx, style='np'))
 
 @bot.command(name='help_music')
 async def help_music(ctx):
@@ -844,6 +2890,7 @@ async def help_music(ctx):
     `!pause` - Pause current track
     `!resume` - Resume playback
     `!skip` - Skip to next track
+    `!seek [mm:ss]` - Jump to a position in the track
     `!previous` - Play previous track
     `!stop` - Stop and clear queue
     """
@@ -851,10 +2898,12 @@ async def help_music(ctx):
     
     # Queue management
     queue_mgmt = """
-    `!queue` - View current queue
+    `!queue [page]` - View current queue
     `!shuffle` - Shuffle queue
     `!clearqueue` - Clear all songs
+    `!cancelimport` - Stop a running playlist import
     `!remove [#]` - Remove song by position
+    `!move [#] [#]` - Move a song to a new position
     """
     embed.add_field(name="📋 Queue", value=queue_mgmt, inline=False)
     
@@ -862,6 +2911,9 @@ async def help_music(ctx):
     info = """
     `!np` - Now playing info
     `!stats` - Bot statistics
+    `!resources` - Voice/FFmpeg/cache usage
+    `!cluster` - Load across bot processes/shards
+    `!lag` - Event-loop lag and recent stalls
     `!lyrics` - Get lyrics link
     `!volume [0-100]` - Set volume
     """
@@ -872,4 +2924,55 @@ async def help_music(ctx):
     
     await ctx.send(embed=embed)
 
-bot.run(DISCORD_TOKEN)
+async def serve_control(reader, writer, reports):
+    """Launcher side of the control channel: collect reports, answer summary requests"""
+    try:
+        while line := await reader.readline():
+            message = json.loads(line)
+            if message['op'] == 'report':
+                reports[str(message['process'])] = message['stats']
+            elif message['op'] == 'summary':
+                writer.write(json.dumps({'processes': reports}).encode() + b'\n')
+                await writer.drain()
+    except (ConnectionError, ValueError) as e:
+        log.warning("Control channel client error: %r", e)
+    finally:
+        writer.close()
+
+async def run_launcher():
+    """Spread the shards over BOT_PROCESSES bot processes, restart any that exit, and host the control channel"""
+    shard_count = SHARD_COUNT or BOT_PROCESSES
+    processes = min(BOT_PROCESSES, shard_count)  # Every process needs at least one shard of its own
+    if processes < BOT_PROCESSES:
+        log.warning("Only %d shards for BOT_PROCESSES=%d; starting %d bot processes", shard_count, BOT_PROCESSES, processes)
+    layout = [list(range(index, shard_count, processes)) for index in range(processes)]
+    reports = {}
+    server = await asyncio.start_server(lambda reader, writer: serve_control(reader, writer, reports), CONTROL_HOST, CONTROL_PORT)
+    
+    async def supervise(index):
+        env = dict(
+            os.environ,
+            SHARD_COUNT=str(shard_count),
+            SHARD_IDS=','.join(map(str, layout[index])),
+            BOT_PROCESS_INDEX=str(index),
+            # Each process keeps its own audio cache; refcounts don't cross process boundaries
+            AUDIO_CACHE_DIR=os.path.join(AUDIO_CACHE_DIR, f'process-{index}'),
+            AUDIO_CACHE_BYTES=str(AUDIO_CACHE_BYTES // processes),
+        )
+        while True:
+            log.info("Starting bot process %d with shards %s of %d", index, layout[index], shard_count)
+            process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), env=env)
+            code = await process.wait()
+            reports.pop(str(index), None)
+            log.warning("Bot process %d exited with code %s, restarting in 5s", index, code)
+            await asyncio.sleep(5)
+    
+    async with server:
+        await asyncio.gather(*(supervise(index) for index in range(processes)))
+
+# Extractor worker processes re-import this module, so only the real entry point starts the bot
+if __name__ == '__main__':
+    if BOT_PROCESSES > 1 and BOT_PROCESS_INDEX is None:
+        asyncio.run(run_launcher())
+    else:
+        bot.run(DISCORD_TOKEN)
@@ -0,0 +1,29 @@
+"""yt-dlp entry points for randotron9000's extractor workers.
+
+Kept apart from the bot module, with no import-time side effects, so that worker processes only ever load yt-dlp.
+"""
+import yt_dlp
+
+worker_ytdl = None  # The YoutubeDL owned by this worker process (or shared by the fallback threads)
+worker_options = None
+
+def init_extractor_worker(options):
+    global worker_ytdl, worker_options
+    worker_ytdl = yt_dlp.YoutubeDL(options)
+    worker_options = options
+
+def extract_in_worker(url, download):
+    try:
+        data = worker_ytdl.extract_info(url, download=download)
+    except yt_dlp.utils.DownloadError as e:
+        raise yt_dlp.utils.DownloadError(str(e)) from None  # Its exc_info traceback doesn't pickle back to the bot
+    return yt_dlp.YoutubeDL.sanitize_info(data)  # Plain dicts/lists so the result pickles back cheaply
+
+def extract_playlist_page(url, start, count):
+    # Flat extraction only lists the videos; each one gets resolved when it comes up to play
+    options = dict(worker_options, noplaylist=False, extract_flat='in_playlist', playlist_items=f'{start}-{start + count - 1}')
+    with yt_dlp.YoutubeDL(options) as ytdl:
+        try:
+            return yt_dlp.YoutubeDL.sanitize_info(ytdl.extract_info(url, download=False))
+        except yt_dlp.utils.DownloadError as e:
+            raise yt_dlp.utils.DownloadError(str(e)) from None
@@ -0,0 +1,37 @@
+import asyncio
+import os
+import tempfile
+import types
+
+os.environ.setdefault('DISCORD_TOKEN', 'test-token')
+os.environ['EXTRACTOR_PROCESSES'] = '0'
+os.environ['SEARCH_CACHE_PATH'] = ':memory:'
+os.environ['STATE_DB_PATH'] = ':memory:'
+os.environ.setdefault('AUDIO_CACHE_DIR', tempfile.mkdtemp(prefix='randotron-test-'))
+
+import randotron9000 as bot_module  # noqa: E402
+
+
+def test_longer_prefix_narrows_the_full_cached_list(monkeypatch):
+    upstream = [f"abc song {i}" for i in range(8)] + ["abcd one", "abcd two"]
+    calls = []
+
+    async def fake_youtube(prefix):
+        calls.append(prefix)
+        return list(upstream)
+
+    monkeypatch.setattr(bot_module, 'fetch_youtube_suggestions', fake_youtube)
+    monkeypatch.setattr(bot_module, 'AUTOCOMPLETE_DEBOUNCE', 0)
+    monkeypatch.setattr(bot_module, 'suggest_cache', bot_module.OrderedDict())
+
+    async def complete(current):
+        interaction = types.SimpleNamespace(user=types.SimpleNamespace(id=1))
+        return [choice.value for choice in await bot_module.song_autocomplete(interaction, current)]
+
+    async def main():
+        return await complete('abc'), await complete('abcd')
+
+    first, narrowed = asyncio.run(main())
+    assert len(first) == bot_module.SUGGESTION_LIMIT
+    assert narrowed == ["abcd one", "abcd two"]
+    assert calls == ['abc']
@@ -0,0 +1,61 @@
+import io
+import os
+import tempfile
+import types
+
+import discord
+import pytest
+
+os.environ.setdefault('DISCORD_TOKEN', 'test-token')
+os.environ['EXTRACTOR_PROCESSES'] = '0'
+os.environ['SEARCH_CACHE_PATH'] = ':memory:'
+os.environ['STATE_DB_PATH'] = ':memory:'
+os.environ.setdefault('AUDIO_CACHE_DIR', tempfile.mkdtemp(prefix='randotron-test-'))
+
+import randotron9000 as bot_module  # noqa: E402
+
+
+@pytest.fixture
+def ffmpeg_args(monkeypatch):
+    """Capture the FFmpeg command lines players would spawn"""
+    spawned = []
+
+    def fake_spawn(self, args, **kwargs):
+        spawned.append(args)
+        return types.SimpleNamespace(stdout=io.BytesIO(), pid=0, returncode=0, kill=lambda: None, poll=lambda: 0)
+
+    monkeypatch.setattr(discord.player.FFmpegAudio, '_spawn_process', fake_spawn)
+    return spawned
+
+
+def build(data, volume):
+    bot_module.YTDLOpusSource.from_data(data, volume=volume)
+
+
+def option_value(args, flag):
+    return args[args.index(flag) + 1]
+
+
+def test_opus_at_unity_gain_is_copied_without_filters(ffmpeg_args):
+    build({'url': 'https://example.invalid/a', 'acodec': 'opus'}, 1.0)
+    args = ffmpeg_args[0]
+    assert option_value(args, '-c:a') == 'copy'
+    assert '-af' not in args
+
+
+@pytest.mark.parametrize('data', [
+    {'url': 'https://example.invalid/a', 'acodec': 'opus'},
+    {'url': 'https://example.invalid/b', 'acodec': 'mp4a.40.2'},
+])
+def test_volume_filter_is_encoded_with_libopus(ffmpeg_args, data):
+    build(data, 0.5)
+    args = ffmpeg_args[0]
+    assert option_value(args, '-c:a') == 'libopus'
+    assert option_value(args, '-af') == 'volume=0.50'
+
+
+def test_non_opus_download_is_never_stream_copied(ffmpeg_args, tmp_path):
+    path = tmp_path / 'abcdefghijk.m4a'
+    path.write_bytes(b'')
+    build({'id': 'abcdefghijk', 'requested_downloads': [{'filepath': str(path)}]}, 1.0)
+    assert option_value(ffmpeg_args[0], '-c:a') == 'libopus'
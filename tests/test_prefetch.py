@@ -0,0 +1,44 @@
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault('DISCORD_TOKEN', 'test-token')
+os.environ['EXTRACTOR_PROCESSES'] = '0'
+os.environ['SEARCH_CACHE_PATH'] = ':memory:'
+os.environ['STATE_DB_PATH'] = ':memory:'
+os.environ.setdefault('AUDIO_CACHE_DIR', tempfile.mkdtemp(prefix='randotron-test-'))
+
+import randotron9000 as bot_module  # noqa: E402
+
+
+def test_discarded_lookaheads_are_cancelled_and_released(monkeypatch, tmp_path):
+    cache = bot_module.AudioCache(str(tmp_path), 1 << 20)
+    monkeypatch.setattr(bot_module, 'audio_cache', cache)
+    started = []
+
+    async def fake_extract(url, download=False):
+        video_id = bot_module.youtube_video_id(url)
+        started.append(video_id)
+        await asyncio.sleep(0.05)
+        path = tmp_path / f"{video_id}.opus"
+        path.write_bytes(b'x')
+        return {'id': video_id, 'requested_downloads': [{'filepath': str(path)}]}
+
+    monkeypatch.setattr(bot_module.extractor, 'extract', fake_extract)
+
+    async def main():
+        bot_module.bot.loop = asyncio.get_running_loop()
+        resolve = lambda video_id: asyncio.ensure_future(  # noqa: E731
+            bot_module.YTDLSource.resolve(f"https://youtu.be/{video_id}", stream=False))
+        finished = resolve('aaaaaaaaaaa')
+        await finished
+        pending = resolve('bbbbbbbbbbb')
+        await asyncio.sleep(0.01)
+        bot_module.discard_prefetch(finished)
+        bot_module.discard_prefetch(pending)
+        await asyncio.sleep(0.1)
+        return pending
+
+    pending = asyncio.run(main())
+    assert pending.cancelled()
+    assert cache.refs == {}
@@ -0,0 +1,35 @@
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault('DISCORD_TOKEN', 'test-token')
+os.environ['EXTRACTOR_PROCESSES'] = '0'
+os.environ['SEARCH_CACHE_PATH'] = ':memory:'
+os.environ['STATE_DB_PATH'] = ':memory:'
+os.environ.setdefault('AUDIO_CACHE_DIR', tempfile.mkdtemp(prefix='randotron-test-'))
+
+import randotron9000 as bot_module  # noqa: E402
+
+
+def test_put_during_a_write_is_flushed(monkeypatch, tmp_path):
+    monkeypatch.setattr(bot_module, 'SEARCH_CACHE_FLUSH_DELAY', 0.01)
+    cache = bot_module.SearchCache(str(tmp_path / 'cache.sqlite3'), 3600, 100)
+    write = cache._write
+
+    def slow_write(rows):
+        time.sleep(0.1)  # A busy shared DB
+        write(rows)
+
+    monkeypatch.setattr(cache, '_write', slow_write)
+
+    async def main():
+        bot_module.bot.loop = asyncio.get_running_loop()
+        cache.put('a', {'v': 1})
+        await asyncio.sleep(0.05)  # 'a' is being written now
+        cache.put('b', {'v': 2})
+        await cache.flushing
+
+    asyncio.run(main())
+    assert cache.dirty == {}
+    assert sorted(row[0] for row in cache.db.execute('SELECT key FROM search_cache')) == ['a', 'b']
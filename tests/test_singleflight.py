@@ -0,0 +1,69 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault('DISCORD_TOKEN', 'test-token')
+os.environ['EXTRACTOR_PROCESSES'] = '0'
+os.environ['SEARCH_CACHE_PATH'] = ':memory:'
+os.environ['STATE_DB_PATH'] = ':memory:'
+os.environ.setdefault('AUDIO_CACHE_DIR', tempfile.mkdtemp(prefix='randotron-test-'))
+
+import randotron9000 as bot_module  # noqa: E402
+
+VIDEO_ID = 'abcdefghijk'
+
+
+@pytest.mark.parametrize('callers', [1, 4])
+def test_shared_download_survives_handover_over_budget(monkeypatch, tmp_path, callers):
+    """A shared download bigger than the cache budget stays on disk until every caller has released it"""
+    cache = bot_module.AudioCache(str(tmp_path), 100)
+    monkeypatch.setattr(bot_module, 'audio_cache', cache)
+    calls = []
+
+    async def fake_extract(url, download=False):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        path = tmp_path / f"{VIDEO_ID}.opus"
+        path.write_bytes(b'x' * 200)
+        return {'id': VIDEO_ID, 'requested_downloads': [{'filepath': str(path)}]}
+
+    monkeypatch.setattr(bot_module.extractor, 'extract', fake_extract)
+
+    async def main():
+        bot_module.bot.loop = asyncio.get_running_loop()
+        urls = [f"https://youtu.be/{VIDEO_ID}", f"https://www.youtube.com/watch?v={VIDEO_ID}"]
+        return await asyncio.gather(*(bot_module.YTDLSource.resolve(urls[i % 2], stream=False) for i in range(callers)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    for data in results:
+        assert os.path.exists(bot_module.downloaded_path(data))
+    assert cache.refs == {VIDEO_ID: len(results)}
+
+    for data in results:
+        bot_module.release_resolved(data)
+    assert cache.refs == {}
+    assert VIDEO_ID not in cache.entries  # Evicted once the last caller let go
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    flights = bot_module.SingleFlight('test')
+    started = []
+
+    async def work():
+        started.append(True)
+        await asyncio.sleep(0.02)
+        return 'done'
+
+    async def main():
+        first = asyncio.ensure_future(flights.run('key', work))
+        second = asyncio.ensure_future(flights.run('key', work))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 'done'
+    assert started == [True]
+    assert flights.inflight == {}